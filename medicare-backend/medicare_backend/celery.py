@@ -0,0 +1,61 @@
+"""
+Celery application for medicare_backend.
+
+Workers are started with ``celery -A medicare_backend worker``; tasks declared
+with ``@shared_task`` in the installed apps are discovered automatically.
+"""
+
+import os
+
+from celery import Celery
+from celery.exceptions import WorkerShutdown
+from celery.signals import worker_init, worker_process_init
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'medicare_backend.settings')
+
+app = Celery('medicare_backend')
+
+# Read CELERY_* options from the Django settings module
+app.config_from_object('django.conf:settings', namespace='CELERY')
+
+app.autodiscover_tasks()
+
+
+@worker_init.connect
+def configure_ocr_threads(sender=None, **kwargs):
+    """
+    Split the node's cores between the pool processes before any OCR
+    library loads; forked children inherit the budget through the environment
+    """
+    from prescriptions.threads import apply_thread_budget, compute_thread_budget
+
+    apply_thread_budget(compute_thread_budget(getattr(sender, 'concurrency', 1)))
+
+
+@worker_process_init.connect
+def apply_ocr_threads(**kwargs):
+    """Re-apply the budget in each pool process, pinning it to its own cores if enabled"""
+    from celery.utils.log import current_process_index
+    from prescriptions.threads import apply_thread_budget, thread_budget
+
+    threads = thread_budget()
+    if threads:
+        apply_thread_budget(threads, slot=current_process_index(base=0))
+
+
+@worker_init.connect
+def preload_ocr_engines(**kwargs):
+    """Load OCR models in the worker's main process, before the pool forks"""
+    from django.conf import settings
+
+    if settings.OCR_PRELOAD_ENGINES:
+        from django.core.exceptions import ImproperlyConfigured
+        from prescriptions.engines import preload_engines
+
+        try:
+            preload_engines()
+        except ImproperlyConfigured as e:
+            # Celery logs and swallows ordinary exceptions from signal receivers;
+            # WorkerShutdown is a SystemExit, so it actually stops the worker.
+            # Logging isn't set up yet at worker_init, so the message goes out with the exit.
+            raise WorkerShutdown(f"Refusing to start worker: {str(e)}")
@@ -280,6 +280,20 @@ CACHES = {
     }
 }
 
+# Celery Configuration
+CELERY_BROKER_URL = config('CELERY_BROKER_URL', default=config('REDIS_URL', default='redis://redis:6379/0'))
+CELERY_RESULT_BACKEND = config('CELERY_RESULT_BACKEND', default=CELERY_BROKER_URL)
+CELERY_ACCEPT_CONTENT = ['json']
+CELERY_TASK_SERIALIZER = 'json'
+CELERY_RESULT_SERIALIZER = 'json'
+CELERY_TIMEZONE = TIME_ZONE
+CELERY_BEAT_SCHEDULE = {
+    'cleanup-expired-upload-sessions': {
+        'task': 'prescriptions.tasks.cleanup_expired_upload_sessions',
+        'schedule': 60 * 60,
+    },
+}
+
 # Security Settings
 if not DEBUG:
     SECURE_BROWSER_XSS_FILTER = True
@@ -293,6 +307,130 @@ if not DEBUG:
 OTP_EXPIRY_MINUTES = config('OTP_EXPIRY_MINUTES', default=10, cast=int)
 OTP_LENGTH = config('OTP_LENGTH', default=6, cast=int)
 
+# Prescription processing
+# When enabled, uploads only store the images and return 202; OCR runs in Celery
+PRESCRIPTION_ASYNC_UPLOAD = config('PRESCRIPTION_ASYNC_UPLOAD', default=False, cast=bool)
+# PDF uploads are rasterized page by page at this resolution
+PDF_RASTER_DPI = config('PDF_RASTER_DPI', default=300, cast=int)
+# Pages that would render larger are rendered at a lower DPI; pages over it even at 72 DPI are rejected
+PDF_MAX_PAGE_PIXELS = config('PDF_MAX_PAGE_PIXELS', default=40_000_000, cast=int)
+PRESCRIPTION_MAX_PDF_PAGES = config('PRESCRIPTION_MAX_PDF_PAGES', default=20, cast=int)
+# Prescription uploads stream to temp files; these limits cut them off while the bytes arrive
+PRESCRIPTION_MAX_FILE_BYTES = config('PRESCRIPTION_MAX_FILE_BYTES', default=10 * 1024 * 1024, cast=int)
+PRESCRIPTION_MAX_UPLOAD_BYTES = config('PRESCRIPTION_MAX_UPLOAD_BYTES', default=100 * 1024 * 1024, cast=int)
+# Resumable uploads keep their chunks here (shared by web and worker) until finalized or expired
+UPLOAD_SESSION_ROOT = config('UPLOAD_SESSION_ROOT', default=str(MEDIA_ROOT / 'upload_sessions'))
+UPLOAD_SESSION_TTL_HOURS = config('UPLOAD_SESSION_TTL_HOURS', default=24, cast=int)
+# A finalize that hasn't finished after this long (its worker died) may be retried
+UPLOAD_SESSION_FINALIZE_TIMEOUT_SECONDS = config('UPLOAD_SESSION_FINALIZE_TIMEOUT_SECONDS', default=600, cast=int)
+# Compressed display copies: the smallest format/quality that keeps COMPRESSION_MIN_PSNR (dB),
+# traded down to the lowest quality step when that still misses the byte budget.
+# Originals already within the budget are served as their own display copy.
+COMPRESSION_TARGET_BYTES = config('COMPRESSION_TARGET_BYTES', default=200_000, cast=int)
+COMPRESSION_MIN_PSNR = config('COMPRESSION_MIN_PSNR', default=34.0, cast=float)
+COMPRESSION_MAX_WIDTH = config('COMPRESSION_MAX_WIDTH', default=1200, cast=int)
+COMPRESSION_FORMATS = config('COMPRESSION_FORMATS', default='WEBP,JPEG').upper().split(',')
+COMPRESSION_QUALITY_STEPS = list(range(40, 95, 5))
+# Binarized OCR images are stored lossless at 1 bit per pixel: 'PNG' or 'TIFF' (CCITT G4)
+PROCESSED_IMAGE_FORMAT = config('PROCESSED_IMAGE_FORMAT', default='PNG').upper()
+# JPEG renditions for the app (longest side in pixels), cached on disk by content hash.
+# They're rendered on first request unless RENDITIONS_AT_INGEST; bump RENDITION_VERSION to re-render.
+PRESCRIPTION_IMAGE_RENDITIONS = {'thumbnail': 200, 'list': 480, 'detail': 1200}
+RENDITION_ROOT = config('RENDITION_ROOT', default=str(MEDIA_ROOT / 'renditions'))
+RENDITION_QUALITY = config('RENDITION_QUALITY', default=80, cast=int)
+RENDITION_VERSION = config('RENDITION_VERSION', default='1')
+RENDITION_MAX_AGE = config('RENDITION_MAX_AGE', default=60 * 60 * 24 * 365, cast=int)
+RENDITIONS_AT_INGEST = config('RENDITIONS_AT_INGEST', default=False, cast=bool)
+
+# OCR engines
+OCR_LANGUAGES = ('en',)
+OCR_PRELOAD_LANGUAGE_SETS = [OCR_LANGUAGES]
+# EasyOCR language set per script detected by Tesseract OSD; other scripts use OCR_LANGUAGES
+OCR_SCRIPT_LANGUAGES = {
+    'Latin': ('en',),
+    'Devanagari': ('hi', 'en'),
+    'Bengali': ('bn', 'en'),
+    'Tamil': ('ta', 'en'),
+    'Telugu': ('te', 'en'),
+    'Kannada': ('kn', 'en'),
+}
+# Optional OCR service (manage.py run_ocr_server) that owns the EasyOCR models;
+# http://host:port or unix:///path. When set, this process never loads EasyOCR itself.
+OCR_SERVICE_URL = config('OCR_SERVICE_URL', default='')
+OCR_SERVICE_TIMEOUT = config('OCR_SERVICE_TIMEOUT', default=60, cast=float)
+OCR_SERVICE_RETRIES = config('OCR_SERVICE_RETRIES', default=2, cast=int)
+# Server side: model-holding worker processes, and waiting requests before answering 503
+OCR_SERVICE_WORKERS = config('OCR_SERVICE_WORKERS', default=2, cast=int)
+OCR_SERVICE_MAX_PENDING = config('OCR_SERVICE_MAX_PENDING', default=32, cast=int)
+# Loaded readers are evicted least recently used first once their combined size passes this (0 = no cap)
+OCR_READER_POOL_MAX_MB = config('OCR_READER_POOL_MAX_MB', default=1024, cast=int)
+# EasyOCR weights are bundled at build time (manage.py fetch_ocr_models), never downloaded on first use
+EASYOCR_MODEL_DIR = config('EASYOCR_MODEL_DIR', default=str(BASE_DIR / 'ocr_models'))
+EASYOCR_DOWNLOAD_ENABLED = config('EASYOCR_DOWNLOAD_ENABLED', default=False, cast=bool)
+# Load OCR models at startup (Celery worker / WSGI master) instead of on the first image
+OCR_PRELOAD_ENGINES = config('OCR_PRELOAD_ENGINES', default=False, cast=bool)
+# 'tiered' runs Tesseract first and EasyOCR only when needed; 'concurrent' always runs both
+OCR_STRATEGY = config('OCR_STRATEGY', default='tiered')
+# Tesseract results at or above this confidence (percent) skip EasyOCR
+OCR_TESSERACT_ACCEPT_CONFIDENCE = config('OCR_TESSERACT_ACCEPT_CONFIDENCE', default=80.0, cast=float)
+OCR_ENGINE_THREADS = config('OCR_ENGINE_THREADS', default=2, cast=int)
+# Threads each worker process gives torch, OpenMP/BLAS, OpenCV and Tesseract;
+# 0 splits the node's cores evenly between the Celery pool processes
+OCR_THREADS_PER_PROCESS = config('OCR_THREADS_PER_PROCESS', default=0, cast=int)
+# Pin each pool process to its own cores (Linux only)
+OCR_PIN_CORES = config('OCR_PIN_CORES', default=False, cast=bool)
+# Micro-batch EasyOCR calls from concurrent tasks through readtext_batched
+OCR_EASYOCR_BATCHING = config('OCR_EASYOCR_BATCHING', default=False, cast=bool)
+OCR_BATCH_MAX_SIZE = config('OCR_BATCH_MAX_SIZE', default=8, cast=int)
+OCR_BATCH_WINDOW_MS = config('OCR_BATCH_WINDOW_MS', default=50, cast=int)
+# Image each engine reads: 'working' (resolution-normalized), 'original' or 'processed' (binarized)
+OCR_TESSERACT_SOURCE = config('OCR_TESSERACT_SOURCE', default='working')
+OCR_EASYOCR_SOURCE = config('OCR_EASYOCR_SOURCE', default='working')
+# The working image scales text to about this height (~300 DPI for 10pt print). Its long side is
+# capped at OCR_WORKING_MAX_DIMENSION, or at OCR_TILED_WORKING_MAX_DIMENSION when tiling is on,
+# since large working images are then recognized in bands rather than shrunk
+OCR_TARGET_TEXT_HEIGHT = config('OCR_TARGET_TEXT_HEIGHT', default=32, cast=int)
+OCR_WORKING_MAX_DIMENSION = config('OCR_WORKING_MAX_DIMENSION', default=2400, cast=int)
+OCR_TILED_WORKING_MAX_DIMENSION = config('OCR_TILED_WORKING_MAX_DIMENSION', default=6000, cast=int)
+# Straighten small skews in the working and processed images; enhance images above the pixel limit in row bands
+OCR_DESKEW = config('OCR_DESKEW', default=True, cast=bool)
+OCR_ENHANCE_TILE_PIXELS = config('OCR_ENHANCE_TILE_PIXELS', default=12_000_000, cast=int)
+OCR_ENHANCE_TILE_ROWS = config('OCR_ENHANCE_TILE_ROWS', default=1024, cast=int)
+# Crop Tesseract's input to detected text bands, unless they cover most of the image anyway
+OCR_ROI_ENABLED = config('OCR_ROI_ENABLED', default=True, cast=bool)
+OCR_ROI_MAX_COVERAGE = config('OCR_ROI_MAX_COVERAGE', default=0.85, cast=float)
+# Images at or above OCR_TILE_MIN_PIXELS (0 turns tiling off) are recognized as overlapping
+# bands across cores. The overlap must be taller than a line of text; 0 workers means one per core.
+OCR_TILE_MIN_PIXELS = config('OCR_TILE_MIN_PIXELS', default=8_000_000, cast=int)
+OCR_TILE_HEIGHT = config('OCR_TILE_HEIGHT', default=1024, cast=int)
+OCR_TILE_OVERLAP = config('OCR_TILE_OVERLAP', default=128, cast=int)
+OCR_TILE_WORKERS = config('OCR_TILE_WORKERS', default=0, cast=int)
+OCR_TILE_START_METHOD = config('OCR_TILE_START_METHOD', default='spawn')
+# Orientation: EXIF rotation is always applied; Tesseract OSD then catches photos taken sideways
+OCR_DETECT_ORIENTATION = config('OCR_DETECT_ORIENTATION', default=True, cast=bool)
+OCR_ORIENTATION_MAX_DIMENSION = config('OCR_ORIENTATION_MAX_DIMENSION', default=1200, cast=int)
+OCR_ORIENTATION_MIN_CONFIDENCE = config('OCR_ORIENTATION_MIN_CONFIDENCE', default=2.0, cast=float)
+# Upload-time quality gate: reject photos OCR can't read before spending a run on them
+OCR_QUALITY_GATE = config('OCR_QUALITY_GATE', default=True, cast=bool)
+OCR_QUALITY_MIN_SIDE = config('OCR_QUALITY_MIN_SIDE', default=500, cast=int)  # pixels
+OCR_QUALITY_MIN_BRIGHTNESS = config('OCR_QUALITY_MIN_BRIGHTNESS', default=50, cast=float)  # mean gray level
+OCR_QUALITY_MIN_CONTRAST = config('OCR_QUALITY_MIN_CONTRAST', default=40, cast=float)  # paper vs darkest ink, gray levels
+OCR_QUALITY_MIN_SHARPNESS = config('OCR_QUALITY_MIN_SHARPNESS', default=20, cast=float)  # Laplacian variance
+OCR_QUALITY_MIN_TEXT_HEIGHT = config('OCR_QUALITY_MIN_TEXT_HEIGHT', default=8, cast=float)  # pixels
+# Latency budgets for the OCR stage; when they run short, images fall back to Tesseract
+OCR_IMAGE_DEADLINE_SECONDS = config('OCR_IMAGE_DEADLINE_SECONDS', default=30, cast=float)
+OCR_PRESCRIPTION_DEADLINE_SECONDS = config('OCR_PRESCRIPTION_DEADLINE_SECONDS', default=120, cast=float)
+OCR_MIN_TESSERACT_SECONDS = config('OCR_MIN_TESSERACT_SECONDS', default=5, cast=float)
+# Latency assumed for an engine until this process has measured it
+OCR_ENGINE_LATENCY_ESTIMATES = {'tesseract': 2.0, 'easyocr': 8.0}
+
+# OCR result cache, keyed by image SHA-256 + pipeline version.
+# Bump OCR_PIPELINE_VERSION when pipeline changes should invalidate cached results.
+OCR_PIPELINE_VERSION = config('OCR_PIPELINE_VERSION', default='9')
+OCR_CACHE_ENABLED = config('OCR_CACHE_ENABLED', default=True, cast=bool)
+OCR_CACHE_ALIAS = config('OCR_CACHE_ALIAS', default='default')
+OCR_CACHE_TIMEOUT = config('OCR_CACHE_TIMEOUT', default=60 * 60 * 24 * 30, cast=int)
+
 # Logging
 LOGGING = {
     'version': 1,
@@ -14,3 +14,11 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'medicare_backend.settings')
 
 application = get_wsgi_application()
+
+# With gunicorn --preload this runs in the master, so workers inherit the
+# loaded OCR models copy-on-write
+from django.conf import settings
+
+if settings.OCR_PRELOAD_ENGINES:
+    from prescriptions.engines import preload_engines
+    preload_engines()
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Prescription, PrescriptionImage, Medicine, PrescriptionAnalytics
+from .models import Prescription, PrescriptionImage, Medicine, PrescriptionAnalytics, UploadSession
 
 
 @admin.register(Prescription)
@@ -36,25 +36,28 @@ class PrescriptionAdmin(admin.ModelAdmin):
 @admin.register(PrescriptionImage)
 class PrescriptionImageAdmin(admin.ModelAdmin):
     list_display = [
-        'id', 'prescription', 'confidence_score', 'file_size', 
+        'id', 'prescription', 'processing_status', 'confidence_score', 'file_size', 
         'width', 'height', 'format', 'created_at'
     ]
-    list_filter = ['format', 'created_at']
-    search_fields = ['prescription__title', 'prescription__user__username']
+    list_filter = ['processing_status', 'format', 'ocr_engine', 'ocr_path', 'ocr_degraded', 'created_at']
+    search_fields = ['prescription__title', 'prescription__user__username', 'content_hash']
     readonly_fields = [
-        'file_size', 'width', 'height', 'format', 'confidence_score',
-        'created_at', 'updated_at'
+        'file_size', 'compression_ratio', 'width', 'height', 'format', 'content_hash', 'confidence_score',
+        'ocr_engine', 'ocr_path', 'ocr_degraded', 'created_at', 'updated_at'
     ]
     
     fieldsets = (
         ('Images', {
-            'fields': ('prescription', 'original_image', 'compressed_image', 'processed_image')
+            'fields': ('prescription', 'page_number', 'original_image', 'compressed_image', 'processed_image')
+        }),
+        ('Processing', {
+            'fields': ('processing_status', 'processing_error')
         }),
         ('OCR Results', {
-            'fields': ('extracted_text', 'confidence_score')
+            'fields': ('extracted_text', 'confidence_score', 'ocr_engine', 'ocr_path', 'ocr_degraded')
         }),
         ('Image Metadata', {
-            'fields': ('file_size', 'width', 'height', 'format'),
+            'fields': ('file_size', 'compression_ratio', 'width', 'height', 'format', 'content_hash'),
             'classes': ('collapse',)
         }),
         ('Timestamps', {
@@ -129,3 +132,11 @@ class PrescriptionAnalyticsAdmin(admin.ModelAdmin):
         self.message_user(request, f"Updated analytics for {queryset.count()} users.")
     
     update_analytics.short_description = "Update selected analytics"
+
+
+@admin.register(UploadSession)
+class UploadSessionAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'status', 'prescription', 'expires_at', 'created_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['id', 'user__email']
+    readonly_fields = ['id', 'files', 'metadata', 'prescription', 'created_at', 'updated_at']
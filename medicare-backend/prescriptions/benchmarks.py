@@ -0,0 +1,202 @@
+"""
+Benchmarks for the OCR pipeline, run through `manage.py benchmark_ocr`.
+
+Each suite takes a list of DecodedImage objects (usually loaded from a
+directory of sample prescriptions) and returns a list of result rows.
+"""
+import os
+import time
+
+from .imaging import DecodedImage
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def load_images(directory, limit=None):
+    """Decode the sample images in a directory"""
+    names = sorted(
+        name for name in os.listdir(directory)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    if limit:
+        names = names[:limit]
+
+    images = []
+    for name in names:
+        with open(os.path.join(directory, name), 'rb') as image_file:
+            images.append(DecodedImage.from_file(image_file))
+    return images
+
+
+def benchmark_easyocr_batching(images, batch_sizes, repeats=1):
+    """
+    Throughput of EasyOCR at different batch sizes.
+    Batch size 1 is the unbatched readtext path the pipeline used to take.
+    """
+    from .engines import get_easyocr_reader, run_easyocr_batch
+
+    reader = get_easyocr_reader()
+    # Warm up so model initialisation isn't counted
+    reader.readtext(images[0].pixels)
+
+    rows = []
+    for batch_size in batch_sizes:
+        started = time.perf_counter()
+        for _ in range(repeats):
+            for offset in range(0, len(images), batch_size):
+                batch = [image.pixels for image in images[offset:offset + batch_size]]
+                if batch_size == 1:
+                    reader.readtext(batch[0])
+                else:
+                    run_easyocr_batch(batch)
+        elapsed = time.perf_counter() - started
+
+        processed = len(images) * repeats
+        rows.append({
+            'batch_size': batch_size,
+            'images': processed,
+            'seconds': round(elapsed, 3),
+            'images_per_second': round(processed / elapsed, 3) if elapsed else 0.0,
+        })
+    return rows
+
+
+def benchmark_ocr_sources(images, engines=('tesseract', 'easyocr'), sources=('original', 'working', 'processed')):
+    """
+    Latency and confidence of each engine on each candidate source image.
+    'original' is what the pipeline used to OCR.
+    """
+    from .utils import ImageProcessor
+
+    processor = ImageProcessor()
+    extract = {
+        'tesseract': processor.extract_tesseract_data,
+        'easyocr': processor.extract_easyocr_data,
+    }
+
+    rows = []
+    for engine in engines:
+        for source in sources:
+            seconds = []
+            confidences = []
+            pixels = 0
+            for image in images:
+                started = time.perf_counter()
+                # Preparing the source is part of the cost of using it
+                source_image = processor.ocr_source(DecodedImage(image.pixels), source)
+                result = extract[engine](source_image)
+                seconds.append(time.perf_counter() - started)
+                confidences.append(result['confidence'])
+                pixels += source_image.width * source_image.height
+
+            rows.append({
+                'engine': engine,
+                'source': source,
+                'mean_megapixels': round(pixels / len(images) / 1e6, 2),
+                'mean_seconds': round(sum(seconds) / len(seconds), 3),
+                'max_seconds': round(max(seconds), 3),
+                'mean_confidence': round(sum(confidences) / len(confidences), 1),
+            })
+    return rows
+
+
+def _legacy_enhance(gray):
+    """The PIL-chain enhancement the pipeline used before the OpenCV rewrite"""
+    import cv2
+    import numpy as np
+    from PIL import Image, ImageEnhance, ImageFilter
+
+    img = Image.fromarray(gray)
+    img = ImageEnhance.Contrast(img).enhance(1.5)
+    img = ImageEnhance.Sharpness(img).enhance(1.2)
+    img = img.filter(ImageFilter.MedianFilter(size=3))
+    cv_img = cv2.cvtColor(np.array(img), cv2.COLOR_GRAY2BGR)
+    gray = cv2.cvtColor(cv_img, cv2.COLOR_BGR2GRAY)
+    return cv2.adaptiveThreshold(
+        gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2
+    )
+
+
+def benchmark_enhancement(images, repeats=3):
+    """
+    Legacy PIL enhancement vs the OpenCV engine, with and without deskew.
+    Agreement is the share of pixels matching the legacy output (deskew off).
+    """
+    import numpy as np
+
+    from .utils import ImageProcessor
+
+    processor = ImageProcessor()
+    variants = {
+        'legacy_pil': lambda image: _legacy_enhance(image.gray),
+        'opencv': lambda image: processor.enhance_array(DecodedImage(image.pixels), deskew=False),
+        'opencv_deskew': lambda image: processor.enhance_array(DecodedImage(image.pixels), deskew=True),
+    }
+
+    reference = [_legacy_enhance(image.gray) for image in images]
+
+    rows = []
+    for name, enhance in variants.items():
+        seconds = []
+        agreement = []
+        for _ in range(repeats):
+            for image, expected in zip(images, reference):
+                started = time.perf_counter()
+                output = enhance(image)
+                seconds.append(time.perf_counter() - started)
+                if name != 'opencv_deskew':
+                    agreement.append(float(np.mean(output == expected)))
+
+        rows.append({
+            'variant': name,
+            'mean_ms': round(sum(seconds) / len(seconds) * 1000, 1),
+            'max_ms': round(max(seconds) * 1000, 1),
+            'pixel_agreement': round(sum(agreement) / len(agreement), 4) if agreement else '-',
+        })
+    return rows
+
+
+def _init_layout_process(threads):
+    from .threads import apply_thread_budget
+    apply_thread_budget(threads)
+
+
+def _process_for_layout(pixels):
+    """Enhance and OCR one image the way a worker process would"""
+    from .utils import ImageProcessor
+
+    processor = ImageProcessor()
+    image = DecodedImage(pixels)
+    processor.enhance_array(image)
+    processor.extract_text_detailed(image)
+
+
+def benchmark_thread_layouts(images, layouts, repeats=1):
+    """
+    Node throughput (images/sec) for process x thread layouts, e.g. 4x2 is
+    four worker processes capped at two threads each. Processes are spawned
+    fresh so each library sizes its pools under the layout's budget.
+    """
+    import multiprocessing
+
+    context = multiprocessing.get_context('spawn')
+    work = [image.pixels for image in images] * repeats
+
+    rows = []
+    for processes, threads in layouts:
+        with context.Pool(processes, initializer=_init_layout_process, initargs=(threads,)) as pool:
+            # Warm up every process so engine loading isn't counted
+            pool.map(_process_for_layout, [images[0].pixels] * processes, chunksize=1)
+
+            started = time.perf_counter()
+            pool.map(_process_for_layout, work, chunksize=1)
+            elapsed = time.perf_counter() - started
+
+        rows.append({
+            'processes': processes,
+            'threads': threads,
+            'images': len(work),
+            'seconds': round(elapsed, 3),
+            'images_per_second': round(len(work) / elapsed, 3) if elapsed else 0.0,
+        })
+    return rows
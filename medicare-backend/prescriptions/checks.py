@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+
+@register('ocr')
+def check_easyocr_models(app_configs, **kwargs):
+    """Warn when bundled EasyOCR weights are missing and downloads are disabled"""
+    if settings.EASYOCR_DOWNLOAD_ENABLED or settings.OCR_SERVICE_URL:
+        return []
+
+    from .engines import missing_easyocr_models
+
+    return [
+        Warning(
+            f"EasyOCR model problem: {problem}",
+            hint="Run `python manage.py fetch_ocr_models` or set EASYOCR_DOWNLOAD_ENABLED=True.",
+            id='prescriptions.W001',
+        )
+        for problem in missing_easyocr_models()
+    ]
@@ -0,0 +1,530 @@
+"""
+Process-wide registry of loaded OCR engines.
+
+EasyOCR readers take seconds and hundreds of MB to build, so they are loaded
+once per process and shared by every ImageProcessor. Celery workers and the
+WSGI master can preload them before forking so child processes share the
+model pages copy-on-write.
+"""
+import gc
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+# Guards the reader pool's LRU order and counters; never held while a model loads
+_pool_lock = threading.Lock()
+_easyocr_readers = OrderedDict()
+# One lock per language set, held while that reader loads so other getters never wait on it
+_reader_load_locks = {}
+_engine_stats = {}
+_ocr_executor = None
+_easyocr_batchers = {}
+_engine_latency = {}
+# Tesseract runs against text-region cropping; 'cropped' excludes full-frame fallbacks
+_roi_stats = {'runs': 0, 'cropped': 0, 'pixel_reduction': 0.0, 'detect_seconds': 0.0}
+# Jobs per engine submitted to the OCR executor and not finished, abandoned ones included
+_engine_backlog = {}
+_backlog_lock = threading.Lock()
+_tile_pool = None
+_tile_pool_pid = None
+_tile_threads = None
+_tile_threads_pid = None
+
+
+def _current_rss_bytes():
+    """Resident memory of the current process in bytes"""
+    try:
+        with open('/proc/self/statm') as statm:
+            resident_pages = int(statm.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        # Not Linux - fall back to the peak RSS (kilobytes on Linux, bytes on macOS)
+        import resource
+        import sys
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _language_key(languages):
+    return tuple(languages or settings.OCR_LANGUAGES)
+
+
+def _reader_stats(key):
+    return _engine_stats.setdefault(f"easyocr:{'+'.join(key)}", {
+        'hits': 0, 'misses': 0, 'loads': 0, 'evictions': 0, 'loaded': False,
+    })
+
+
+def get_easyocr_reader(languages=None):
+    """
+    Return the shared EasyOCR reader for the given languages,
+    loading it on first use in this process. Only callers of the same
+    language set wait for a load. Readers are kept in an LRU pool: a load
+    that takes the pool over OCR_READER_POOL_MAX_MB evicts the least
+    recently used other readers.
+    """
+    key = _language_key(languages)
+    with _pool_lock:
+        reader = _easyocr_readers.get(key)
+        if reader is not None:
+            _easyocr_readers.move_to_end(key)
+            _reader_stats(key)['hits'] += 1
+            return reader
+        load_lock = _reader_load_locks.setdefault(key, threading.Lock())
+
+    with load_lock:
+        with _pool_lock:
+            stats = _reader_stats(key)
+            reader = _easyocr_readers.get(key)
+            if reader is not None:
+                # Loaded by another thread while this one waited
+                _easyocr_readers.move_to_end(key)
+                stats['hits'] += 1
+                return reader
+            stats['misses'] += 1
+
+        import easyocr
+
+        rss_before = _current_rss_bytes()
+        started = time.perf_counter()
+        # Weights come from the bundled model directory; see fetch_ocr_models
+        reader = easyocr.Reader(
+            list(key),
+            gpu=False,
+            model_storage_directory=str(settings.EASYOCR_MODEL_DIR),
+            download_enabled=settings.EASYOCR_DOWNLOAD_ENABLED
+        )
+        load_seconds = time.perf_counter() - started
+        rss_after = _current_rss_bytes()
+
+        with _pool_lock:
+            _easyocr_readers[key] = reader
+            stats.update({
+                'loads': stats['loads'] + 1,
+                'loaded': True,
+                'load_seconds': round(load_seconds, 3),
+                'total_load_seconds': round(stats.get('total_load_seconds', 0.0) + load_seconds, 3),
+                'rss_delta_bytes': rss_after - rss_before,
+                'loaded_at': time.time(),
+            })
+            _evict_readers(keep=key)
+        logger.info(
+            f"Loaded EasyOCR reader {key} in {load_seconds:.2f}s "
+            f"(+{(rss_after - rss_before) / 1024 / 1024:.0f} MB, "
+            f"rss {rss_after / 1024 / 1024:.0f} MB, pid {os.getpid()})"
+        )
+    return reader
+
+
+def _reader_pool_bytes():
+    # A reader's size is the RSS growth measured while loading it
+    return sum(max(_reader_stats(key).get('rss_delta_bytes', 0), 0) for key in _easyocr_readers)
+
+
+def _evict_readers(keep):
+    """Drop least recently used readers until the pool fits its memory cap; caller holds _pool_lock"""
+    limit = settings.OCR_READER_POOL_MAX_MB * 1024 * 1024
+    if not limit:
+        return
+
+    evicted = []
+    for key in list(_easyocr_readers):
+        if _reader_pool_bytes() <= limit:
+            break
+        if key == keep:
+            continue
+        del _easyocr_readers[key]
+        stats = _reader_stats(key)
+        stats['evictions'] += 1
+        stats['loaded'] = False
+        evicted.append(key)
+
+    if evicted:
+        # Readers still in use by another thread are freed when it lets go
+        gc.collect()
+        logger.info(
+            f"Evicted EasyOCR readers {evicted} to stay under "
+            f"{settings.OCR_READER_POOL_MAX_MB} MB (pid {os.getpid()})"
+        )
+
+
+MODEL_MANIFEST = 'manifest.json'
+
+
+def _manifest_path():
+    return os.path.join(str(settings.EASYOCR_MODEL_DIR), MODEL_MANIFEST)
+
+
+def _read_manifest():
+    try:
+        with open(_manifest_path()) as manifest:
+            return json.load(manifest)
+    except (OSError, ValueError):
+        return {}
+
+
+def configured_language_sets():
+    """Every language set a reader may be built for"""
+    language_sets = []
+    for languages in [
+        settings.OCR_LANGUAGES,
+        *settings.OCR_PRELOAD_LANGUAGE_SETS,
+        *settings.OCR_SCRIPT_LANGUAGES.values(),
+    ]:
+        key = _language_key(languages)
+        if key not in language_sets:
+            language_sets.append(key)
+    return language_sets
+
+
+def fetch_easyocr_models(languages):
+    """
+    Download the weights for a language set into EASYOCR_MODEL_DIR and record
+    them in the directory's manifest. Returns {file name: size in bytes}.
+    """
+    import easyocr
+
+    key = _language_key(languages)
+    model_dir = str(settings.EASYOCR_MODEL_DIR)
+    os.makedirs(model_dir, exist_ok=True)
+
+    # Building a reader with downloads enabled fetches whatever it is missing
+    easyocr.Reader(list(key), gpu=False, model_storage_directory=model_dir, download_enabled=True)
+
+    # Every weight file now on disk covers this set; shared files (the detector) included
+    files = {
+        name: os.path.getsize(os.path.join(model_dir, name))
+        for name in sorted(os.listdir(model_dir)) if name.endswith('.pth')
+    }
+    manifest = _read_manifest()
+    manifest['+'.join(key)] = files
+    with open(_manifest_path(), 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+    return files
+
+
+def missing_easyocr_models(language_sets=None):
+    """Problems with the bundled weights for the given (default: configured) language sets"""
+    model_dir = str(settings.EASYOCR_MODEL_DIR)
+    manifest = _read_manifest()
+
+    problems = []
+    for key in language_sets or configured_language_sets():
+        name = '+'.join(_language_key(key))
+        files = manifest.get(name)
+        if files is None:
+            problems.append(f"no models fetched for languages {name}")
+            continue
+        for file_name, size in files.items():
+            path = os.path.join(model_dir, file_name)
+            if not os.path.exists(path):
+                problems.append(f"{file_name} ({name}) is missing")
+            elif os.path.getsize(path) != size:
+                problems.append(f"{file_name} ({name}) is incomplete")
+    return problems
+
+
+def verify_easyocr_models():
+    """
+    Fail fast when readers can't be built because bundled weights are
+    missing and downloads are disabled
+    """
+    if settings.EASYOCR_DOWNLOAD_ENABLED or settings.OCR_SERVICE_URL:
+        return
+
+    problems = missing_easyocr_models()
+    if problems:
+        raise ImproperlyConfigured(
+            f"EasyOCR models in {settings.EASYOCR_MODEL_DIR} are not usable: "
+            f"{'; '.join(problems)}. Run `python manage.py fetch_ocr_models`."
+        )
+
+
+def languages_for_script(script):
+    """EasyOCR language set for a script reported by orientation detection"""
+    return _language_key(settings.OCR_SCRIPT_LANGUAGES.get(script))
+
+
+def get_ocr_executor():
+    """
+    Thread pool used to run OCR engines side by side. Tesseract runs as a
+    subprocess and torch releases the GIL, so threads overlap well.
+    Created lazily so it is never inherited across a fork.
+    """
+    global _ocr_executor
+    if _ocr_executor is None:
+        with _lock:
+            if _ocr_executor is None:
+                from concurrent.futures import ThreadPoolExecutor
+                _ocr_executor = ThreadPoolExecutor(
+                    max_workers=settings.OCR_ENGINE_THREADS,
+                    thread_name_prefix='ocr-engine'
+                )
+    return _ocr_executor
+
+
+def submit_engine(engine, fn, *args, **kwargs):
+    """
+    Run fn on the OCR executor, counting it in the engine's backlog until it
+    finishes. A run abandoned at the deadline keeps its executor thread, so
+    the backlog tells later callers how long they would queue behind it.
+    """
+    with _backlog_lock:
+        _engine_backlog[engine] = _engine_backlog.get(engine, 0) + 1
+
+    def release(future):
+        with _backlog_lock:
+            _engine_backlog[engine] -= 1
+
+    future = get_ocr_executor().submit(fn, *args, **kwargs)
+    future.add_done_callback(release)
+    return future
+
+
+def engine_backlog(engine):
+    """Jobs of an engine queued or running on the OCR executor"""
+    return _engine_backlog.get(engine, 0)
+
+
+def _tile_workers():
+    from .threads import thread_budget
+
+    return settings.OCR_TILE_WORKERS or thread_budget() or os.cpu_count() or 1
+
+
+def get_tile_pool():
+    """
+    Pool that recognizes the Tesseract tiles of very large images in
+    parallel, one worker per core of this process's thread budget unless
+    OCR_TILE_WORKERS says otherwise. Processes are
+    started with OCR_TILE_START_METHOD; 'spawn' avoids forking a process
+    whose torch thread pools are already running. Daemonic processes (such
+    as Celery prefork children) can't start children, so there the pool
+    falls back to threads, which still spread Tesseract's subprocesses
+    across cores.
+    """
+    global _tile_pool, _tile_pool_pid
+    if _tile_pool is not None and _tile_pool_pid == os.getpid():
+        return _tile_pool
+
+    with _lock:
+        if _tile_pool is None or _tile_pool_pid != os.getpid():
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+            from .threads import apply_thread_budget
+
+            workers = _tile_workers()
+            if multiprocessing.current_process().daemon:
+                logger.info(f"Daemonic process {os.getpid()}: recognizing tiles in {workers} threads")
+                _tile_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ocr-tile')
+            else:
+                # Tiles are the parallelism, so each tile process runs single-threaded
+                _tile_pool = ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context(settings.OCR_TILE_START_METHOD),
+                    initializer=apply_thread_budget,
+                    initargs=(1,)
+                )
+            _tile_pool_pid = os.getpid()
+    return _tile_pool
+
+
+def get_tile_threads():
+    """
+    Thread pool that recognizes EasyOCR tiles in parallel against this
+    process's shared reader (torch releases the GIL during inference).
+    Tile processes would each load their own copy of the model.
+    """
+    global _tile_threads, _tile_threads_pid
+    if _tile_threads is not None and _tile_threads_pid == os.getpid():
+        return _tile_threads
+
+    with _lock:
+        if _tile_threads is None or _tile_threads_pid != os.getpid():
+            from concurrent.futures import ThreadPoolExecutor
+
+            _tile_threads = ThreadPoolExecutor(max_workers=_tile_workers(), thread_name_prefix='ocr-tile')
+            _tile_threads_pid = os.getpid()
+    return _tile_threads
+
+
+class MicroBatcher:
+    """
+    Collects items submitted by concurrent callers for up to window_seconds
+    (or until max_batch_size items are waiting) and runs them through one
+    batched call. Each caller blocks only on its own result. With several
+    workers, that many batches can be running at once (e.g. one per process
+    of a pool that run_batch hands them to).
+    """
+
+    def __init__(self, run_batch, max_batch_size=8, window_seconds=0.05, workers=1):
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.window_seconds = window_seconds
+        self.workers = workers
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        self._worker_pid = None
+
+    def submit(self, item):
+        """Queue an item and return a Future for its result"""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def run(self, item, timeout=None):
+        """Queue an item and wait for its result"""
+        return self.submit(item).result(timeout=timeout)
+
+    def _ensure_worker(self):
+        # Threads don't survive a fork, so start one per process
+        if self._worker is not None and self._worker_pid == os.getpid():
+            return
+        with self._lock:
+            if self._worker is None or self._worker_pid != os.getpid():
+                self._queue = queue.Queue()
+                threads = [
+                    threading.Thread(target=self._collect_batches, name='ocr-batcher', daemon=True)
+                    for _ in range(self.workers)
+                ]
+                for thread in threads:
+                    thread.start()
+                self._worker = threads[0]
+                self._worker_pid = os.getpid()
+
+    def _collect_batches(self):
+        while True:
+            batch = [self._queue.get()]
+            window_ends = time.monotonic() + self.window_seconds
+
+            while len(batch) < self.max_batch_size:
+                remaining = window_ends - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            futures = [future for _, future in batch]
+            try:
+                results = self.run_batch([item for item, _ in batch])
+                for future, result in zip(futures, results):
+                    future.set_result(result)
+            except Exception as e:
+                logger.error(f"Error running OCR batch of {len(batch)}: {str(e)}")
+                for future in futures:
+                    future.set_exception(e)
+
+
+def pad_to_common_shape(images, fill=255):
+    """
+    Pad images (2D grayscale or 3D RGB) with white at the bottom/right so
+    they share one shape, as EasyOCR's batched API requires. Padding keeps
+    box coordinates valid in each image's own frame.
+    """
+    import numpy as np
+
+    rgb = [np.dstack([img] * 3) if img.ndim == 2 else img for img in images]
+    height = max(img.shape[0] for img in rgb)
+    width = max(img.shape[1] for img in rgb)
+
+    padded = np.full((len(rgb), height, width, 3), fill, dtype=np.uint8)
+    for i, img in enumerate(rgb):
+        padded[i, :img.shape[0], :img.shape[1]] = img
+    return padded
+
+
+def run_easyocr_batch(images, languages=None):
+    """Run EasyOCR detection over a batch of images in one pass"""
+    reader = get_easyocr_reader(languages)
+    padded = pad_to_common_shape(images)
+    return reader.readtext_batched(list(padded), batch_size=len(images))
+
+
+def get_easyocr_batcher(languages=None):
+    """Shared micro-batcher in front of the EasyOCR reader for these languages"""
+    key = _language_key(languages)
+    batcher = _easyocr_batchers.get(key)
+    if batcher is None:
+        with _lock:
+            batcher = _easyocr_batchers.get(key)
+            if batcher is None:
+                batcher = MicroBatcher(
+                    lambda images: run_easyocr_batch(images, key),
+                    max_batch_size=settings.OCR_BATCH_MAX_SIZE,
+                    window_seconds=settings.OCR_BATCH_WINDOW_MS / 1000
+                )
+                _easyocr_batchers[key] = batcher
+    return batcher
+
+
+def record_engine_latency(engine, seconds):
+    """Fold an engine run into its moving-average latency"""
+    previous = _engine_latency.get(engine)
+    _engine_latency[engine] = seconds if previous is None else 0.8 * previous + 0.2 * seconds
+
+
+def record_roi(reduction, detect_seconds):
+    """Fold a Tesseract run into the text-region stats; a reduction of 0 means it read the full frame"""
+    _roi_stats['runs'] += 1
+    _roi_stats['cropped'] += 1 if reduction else 0
+    _roi_stats['pixel_reduction'] += reduction
+    _roi_stats['detect_seconds'] += detect_seconds
+
+
+def expected_engine_latency(engine):
+    """Typical latency of an engine in this process, or the configured estimate before any run"""
+    return _engine_latency.get(engine, settings.OCR_ENGINE_LATENCY_ESTIMATES.get(engine, 0.0))
+
+
+def preload_engines():
+    """Load the configured OCR engines so the first image doesn't pay for it"""
+    if settings.OCR_SERVICE_URL:
+        logger.info(f"EasyOCR runs in the OCR service at {settings.OCR_SERVICE_URL}; not loading it here")
+        return engine_stats()
+
+    verify_easyocr_models()
+
+    for languages in settings.OCR_PRELOAD_LANGUAGE_SETS:
+        try:
+            get_easyocr_reader(languages)
+        except Exception as e:
+            logger.error(f"Error preloading EasyOCR reader {languages}: {str(e)}")
+    return engine_stats()
+
+
+def engine_stats():
+    """Load time and memory figures for the engines loaded in this process"""
+    runs = _roi_stats['runs']
+    return {
+        'pid': os.getpid(),
+        'rss_bytes': _current_rss_bytes(),
+        'engines': {name: dict(stats) for name, stats in _engine_stats.items()},
+        'reader_pool': {
+            'readers': ['+'.join(key) for key in _easyocr_readers],  # least recently used first
+            'size_bytes': _reader_pool_bytes(),
+            'max_bytes': settings.OCR_READER_POOL_MAX_MB * 1024 * 1024,
+        },
+        'latency_seconds': {engine: round(seconds, 3) for engine, seconds in _engine_latency.items()},
+        'roi': {
+            'runs': runs,
+            'cropped': _roi_stats['cropped'],
+            'mean_pixel_reduction': round(_roi_stats['pixel_reduction'] / runs, 3) if runs else None,
+            'mean_detect_seconds': round(_roi_stats['detect_seconds'] / runs, 3) if runs else None,
+        },
+    }
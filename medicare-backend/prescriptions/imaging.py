@@ -0,0 +1,236 @@
+"""
+Decode-once image buffers shared by the processing stages.
+"""
+import hashlib
+import io
+import math
+import os
+from functools import cached_property
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+
+EXIF_ORIENTATION = 0x0112
+
+
+def compute_content_hash(image_file):
+    """SHA-256 of a file's bytes, read in chunks so large uploads aren't loaded whole"""
+    # Uploads streamed through PrescriptionUploadHandler were hashed as they arrived
+    content_hash = getattr(image_file, 'content_hash', None)
+    if content_hash:
+        return content_hash
+
+    digest = hashlib.sha256()
+
+    if hasattr(image_file, 'chunks'):
+        chunks = image_file.chunks()
+    else:
+        image_file.seek(0)
+        chunks = iter(lambda: image_file.read(64 * 1024), b'')
+
+    for chunk in chunks:
+        digest.update(chunk)
+
+    image_file.seek(0)
+    return digest.hexdigest()
+
+
+def is_pdf(upload):
+    """Whether an uploaded file is a PDF, going by its header bytes"""
+    upload.seek(0)
+    header = upload.read(5)
+    upload.seek(0)
+    return header == b'%PDF-'
+
+
+def _open_pdf(pdf_file):
+    import pypdfium2 as pdfium
+
+    # Let pdfium read from disk when Django has spooled the upload to a temp file
+    if hasattr(pdf_file, 'temporary_file_path'):
+        return pdfium.PdfDocument(pdf_file.temporary_file_path())
+    pdf_file.seek(0)
+    return pdfium.PdfDocument(pdf_file)
+
+
+def count_pdf_pages(pdf_file):
+    """Number of pages, read from the PDF structure without rendering anything"""
+    pdf = _open_pdf(pdf_file)
+    try:
+        return len(pdf)
+    finally:
+        pdf.close()
+
+
+def pdf_page_sizes(pdf_file):
+    """(width, height) of each page in points, read without rendering anything"""
+    pdf = _open_pdf(pdf_file)
+    try:
+        return [pdf.get_page_size(index) for index in range(len(pdf))]
+    finally:
+        pdf.close()
+
+
+def pdf_render_scale(width, height, dpi=300, max_pixels=None):
+    """
+    Render scale for a page of width x height points at dpi, lowered so the
+    bitmap stays within max_pixels (default PDF_MAX_PAGE_PIXELS)
+    """
+    max_pixels = max_pixels or settings.PDF_MAX_PAGE_PIXELS
+    scale = dpi / 72
+    if width * height * scale * scale > max_pixels:
+        # Rounded down so pdfium's rounding of the bitmap size can't overshoot
+        scale = math.floor((max_pixels / (width * height)) ** 0.5 * 100) / 100
+    return scale
+
+
+def iter_pdf_pages(pdf_file, dpi=300):
+    """
+    Rasterize a PDF one page at a time, yielding (page_number, ContentFile)
+    PNG pages. Only one rendered page is held in memory at a time, and each
+    is capped at PDF_MAX_PAGE_PIXELS, so peak memory stays bounded.
+    """
+    stem = os.path.splitext(os.path.basename(getattr(pdf_file, 'name', '') or 'document'))[0]
+    pdf = _open_pdf(pdf_file)
+    try:
+        for index in range(len(pdf)):
+            page = pdf[index]
+            try:
+                # A huge MediaBox would otherwise render to a multi-GB bitmap
+                bitmap = page.render(scale=pdf_render_scale(*page.get_size(), dpi=dpi))
+                rendered = bitmap.to_pil()
+                output = io.BytesIO()
+                rendered.save(output, format='PNG')
+                rendered.close()
+                bitmap.close()
+            finally:
+                page.close()
+
+            yield index + 1, ContentFile(output.getvalue(), name=f"{stem}_page{index + 1}.png")
+    finally:
+        pdf.close()
+
+
+def flatten_transparency(img):
+    """RGB copy with transparency flattened onto white, like a scanned page"""
+    img = img.convert('RGBA')
+    background = Image.new('RGB', img.size, (255, 255, 255))
+    background.paste(img, mask=img.split()[-1])
+    return background
+
+
+def decode_preview(image_file, max_side=1600):
+    """
+    Decode a grayscale copy whose long side is at most max_side pixels.
+    JPEGs are scaled down inside the decoder (draft mode), so a 12 MP photo
+    never gets decoded at full size. Returns (pixels, original_size).
+    """
+    import numpy as np
+
+    if hasattr(image_file, 'seek'):
+        image_file.seek(0)
+
+    img = Image.open(image_file)
+    try:
+        original_size = img.size
+        # draft() keeps both sides at or above the requested size, so ask for the target shape
+        scale = min(1.0, max_side / max(original_size))
+        img.draft('L', (int(original_size[0] * scale), int(original_size[1] * scale)))
+        img = img.convert('L')
+        img.thumbnail((max_side, max_side))
+        pixels = np.asarray(img)
+    finally:
+        img.close()
+        if hasattr(image_file, 'seek'):
+            image_file.seek(0)
+
+    return pixels, original_size
+
+
+class DecodedImage:
+    """
+    An uploaded image decoded a single time into a NumPy buffer.
+
+    Metadata, compression, enhancement and OCR all read views of the same
+    pixels instead of re-opening and re-decoding the file.
+    """
+
+    def __init__(self, pixels, format=None, file_size=0, scale=1.0, skew=0.0):
+        self.pixels = pixels  # (H, W, 3) RGB or (H, W) grayscale, uint8
+        self.format = format
+        self.file_size = file_size
+        # Size relative to the original upload, for buffers derived by resizing
+        self.scale = scale
+        # Degrees the original was turned about its centre to straighten it, for deskewed buffers
+        self.skew = skew
+        # Whether decoding turned the pixels per an EXIF orientation tag
+        self.exif_transposed = False
+        # Buffers derived from these pixels (working image, enhanced image), computed once
+        self.derived = {}
+
+    @classmethod
+    def from_file(cls, image_file):
+        """Decode an uploaded file or FieldFile"""
+        import numpy as np
+
+        if hasattr(image_file, 'seek'):
+            image_file.seek(0)
+
+        # Leaving the with block, unlike close(), leaves the caller's file open for storage to save
+        with Image.open(image_file) as img:
+            image_format = img.format
+
+            # Phone cameras store the rotation in EXIF instead of rotating the pixels
+            exif_transposed = img.getexif().get(EXIF_ORIENTATION, 1) != 1
+            if exif_transposed:
+                img = ImageOps.exif_transpose(img)
+
+            if img.mode in ('RGBA', 'LA', 'P'):
+                img = flatten_transparency(img)
+            elif img.mode == '1':
+                # Bilevel processed images
+                img = img.convert('L')
+            elif img.mode not in ('RGB', 'L'):
+                img = img.convert('RGB')
+
+            pixels = np.asarray(img)
+
+        decoded = cls(pixels, format=image_format, file_size=getattr(image_file, 'size', 0) or 0)
+        decoded.exif_transposed = exif_transposed
+        return decoded
+
+    @property
+    def width(self):
+        return self.pixels.shape[1]
+
+    @property
+    def height(self):
+        return self.pixels.shape[0]
+
+    @property
+    def size(self):
+        return self.width, self.height
+
+    def rotated(self, degrees):
+        """Copy turned clockwise by a multiple of 90 degrees"""
+        import numpy as np
+
+        pixels = np.ascontiguousarray(np.rot90(self.pixels, k=-(degrees // 90)))
+        rotated = DecodedImage(pixels, format=self.format, file_size=self.file_size, scale=self.scale)
+        rotated.exif_transposed = self.exif_transposed
+        return rotated
+
+    @cached_property
+    def gray(self):
+        """Grayscale view, converted at most once"""
+        if self.pixels.ndim == 2:
+            return self.pixels
+
+        import cv2
+        return cv2.cvtColor(self.pixels, cv2.COLOR_RGB2GRAY)
+
+    def to_pil(self):
+        """PIL image over the decoded pixels, for encoders that need one"""
+        return Image.fromarray(self.pixels)
@@ -0,0 +1,88 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from prescriptions import benchmarks
+
+
+class Command(BaseCommand):
+    help = 'Benchmark OCR pipeline stages against a directory of sample prescription images'
+
+    SUITES = {
+        'batching': 'EasyOCR throughput (images/sec) across batch sizes',
+        'sources': 'Engine latency and confidence on original vs working vs processed images',
+        'enhance': 'Legacy PIL enhancement vs the OpenCV engine (latency, pixel agreement)',
+        'threads': 'Node throughput (images/sec) across worker process x thread layouts',
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument('suite', choices=sorted(self.SUITES), help='Benchmark to run')
+        parser.add_argument('--images', required=True, help='Directory of sample JPEG/PNG images')
+        parser.add_argument('--limit', type=int, default=None, help='Use at most this many images')
+        parser.add_argument('--repeats', type=int, default=1, help='Passes over the image set')
+        parser.add_argument(
+            '--batch-sizes', default='1,2,4,8',
+            help='Comma separated batch sizes for the batching suite'
+        )
+        parser.add_argument(
+            '--engines', default='tesseract,easyocr',
+            help='Comma separated engines for the sources suite'
+        )
+        parser.add_argument(
+            '--layouts', default=None,
+            help='Comma separated PROCESSESxTHREADS layouts for the threads suite '
+                 '(default: every power-of-two split of the available cores)'
+        )
+
+    def handle(self, *args, **options):
+        images = benchmarks.load_images(options['images'], options['limit'])
+        if not images:
+            raise CommandError(f"No JPEG/PNG images found in {options['images']}")
+
+        suite = options['suite']
+        self.stdout.write(f"{self.SUITES[suite]} - {len(images)} images")
+
+        if suite == 'batching':
+            batch_sizes = [int(size) for size in options['batch_sizes'].split(',')]
+            rows = benchmarks.benchmark_easyocr_batching(images, batch_sizes, options['repeats'])
+        elif suite == 'sources':
+            rows = benchmarks.benchmark_ocr_sources(images, options['engines'].split(','))
+        elif suite == 'enhance':
+            rows = benchmarks.benchmark_enhancement(images, options['repeats'])
+        elif suite == 'threads':
+            rows = benchmarks.benchmark_thread_layouts(
+                images, self._parse_layouts(options['layouts']), options['repeats']
+            )
+
+        self._write_table(rows)
+
+    def _parse_layouts(self, value):
+        if not value:
+            from prescriptions.threads import available_cores
+
+            cores = len(available_cores())
+            layouts = []
+            processes = 1
+            while processes <= cores:
+                layouts.append((processes, cores // processes))
+                processes *= 2
+            return layouts
+
+        layouts = []
+        for layout in value.split(','):
+            try:
+                processes, threads = (int(part) for part in layout.lower().split('x'))
+            except ValueError:
+                raise CommandError(f"Invalid layout '{layout}', expected PROCESSESxTHREADS")
+            layouts.append((processes, threads))
+        return layouts
+
+    def _write_table(self, rows):
+        if not rows:
+            return
+        columns = list(rows[0])
+        widths = {
+            column: max(len(column), *(len(str(row[column])) for row in rows))
+            for column in columns
+        }
+        self.stdout.write('  '.join(column.ljust(widths[column]) for column in columns))
+        for row in rows:
+            self.stdout.write('  '.join(str(row[column]).ljust(widths[column]) for column in columns))
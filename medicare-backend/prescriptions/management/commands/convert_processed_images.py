@@ -0,0 +1,109 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from prescriptions.imaging import DecodedImage
+from prescriptions.models import PrescriptionImage
+from prescriptions.ocr_cache import get_cached_result, store_result
+from prescriptions.utils import ImageProcessor
+
+
+class Command(BaseCommand):
+    help = 'Re-encode stored processed images as lossless 1-bit files and report the space reclaimed'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help='Files converted in parallel (default: one per core)'
+        )
+        parser.add_argument('--limit', type=int, default=None, help='Convert at most this many files')
+        parser.add_argument('--dry-run', action='store_true', help='Encode and report without writing anything')
+        parser.add_argument('--keep-old', action='store_true', help='Leave the old files in storage')
+
+    def handle(self, *args, **options):
+        self.processor = ImageProcessor()
+        self.extension = f".{ImageProcessor.BILEVEL_EXTENSIONS[settings.PROCESSED_IMAGE_FORMAT]}"
+        dry_run = options['dry_run']
+
+        # Images processed from an OCR cache hit may share files, so each file is converted once
+        names = (
+            PrescriptionImage.objects
+            .exclude(processed_image__isnull=True)
+            .exclude(processed_image='')
+            .exclude(processed_image__endswith=self.extension)
+            .order_by('processed_image')
+            .values_list('processed_image', flat=True)
+            .distinct()
+        )
+        if options['limit']:
+            names = names[:options['limit']]
+        names = list(names)
+
+        self.stdout.write(
+            f"Converting {len(names)} processed images to {settings.PROCESSED_IMAGE_FORMAT} "
+            f"with {options['workers']} workers{' (dry run)' if dry_run else ''}..."
+        )
+
+        converted = failed = bytes_before = bytes_after = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            futures = {pool.submit(self._convert, name, dry_run): name for name in names}
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    old_size, new_size, new_name = future.result()
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f"  {name}: {str(e)}")
+                    continue
+
+                # Rows are repointed from this thread so workers never touch the database
+                if not dry_run:
+                    PrescriptionImage.objects.filter(processed_image=name).update(processed_image=new_name)
+                    self._repoint_cached_results(name, new_name)
+                    if not options['keep_old']:
+                        default_storage.delete(name)
+
+                converted += 1
+                bytes_before += old_size
+                bytes_after += new_size
+
+        reclaimed = bytes_before - bytes_after
+        percent = 100 * reclaimed / bytes_before if bytes_before else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Converted {converted} files ({failed} failed): {bytes_before / 1024 / 1024:.1f} MB -> "
+            f"{bytes_after / 1024 / 1024:.1f} MB, {reclaimed / 1024 / 1024:.1f} MB reclaimed ({percent:.0f}%)"
+        ))
+
+    def _repoint_cached_results(self, name, new_name):
+        """
+        Point OCR cache entries that hand out the old file at the new one;
+        otherwise later cache hits find the old file gone and copy nothing
+        """
+        content_hashes = (
+            PrescriptionImage.objects
+            .filter(processed_image=new_name)
+            .exclude(content_hash__isnull=True)
+            .values_list('content_hash', flat=True)
+            .distinct()
+        )
+        for content_hash in content_hashes:
+            cached = get_cached_result(content_hash)
+            if cached and cached.get('processed_image') == name:
+                store_result(content_hash, dict(cached, processed_image=new_name))
+
+    def _convert(self, name, dry_run):
+        """(old size, new size, new name) for one stored file"""
+        old_size = default_storage.size(name)
+        with default_storage.open(name) as image_file:
+            decoded = DecodedImage.from_file(image_file)
+
+        # Thresholding again drops the gray JPEG ringing around the strokes
+        content = self.processor.encode_bilevel(decoded.gray)
+        if dry_run:
+            return old_size, content.size, name
+
+        new_name = default_storage.save(os.path.splitext(name)[0] + self.extension, content)
+        return old_size, content.size, new_name
@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from prescriptions.engines import configured_language_sets, fetch_easyocr_models
+
+
+class Command(BaseCommand):
+    help = 'Download EasyOCR weights into EASYOCR_MODEL_DIR, e.g. while building the image'
+
+    # The model check would flag the very models this command fetches
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--languages', action='append', default=None,
+            help='Comma separated language set, repeatable (default: the configured sets)'
+        )
+
+    def handle(self, *args, **options):
+        if options['languages']:
+            language_sets = [tuple(value.split(',')) for value in options['languages']]
+        else:
+            language_sets = configured_language_sets()
+
+        for languages in language_sets:
+            self.stdout.write(f"Fetching EasyOCR models for {'+'.join(languages)}...")
+            try:
+                files = fetch_easyocr_models(languages)
+            except Exception as e:
+                raise CommandError(f"Failed to fetch models for {'+'.join(languages)}: {str(e)}")
+
+            for name, size in files.items():
+                self.stdout.write(f"  {name} ({size / 1024 / 1024:.1f} MB)")
+
+        self.stdout.write(self.style.SUCCESS(f"Models ready in {settings.EASYOCR_MODEL_DIR}"))
@@ -0,0 +1,48 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from prescriptions.ocr_service import OCRService, make_server
+
+
+class Command(BaseCommand):
+    help = 'Run the OCR service that web and Celery processes use when OCR_SERVICE_URL is set'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url', default='http://127.0.0.1:8765',
+            help='Address to listen on: http://host:port or unix:///path/to/socket'
+        )
+        parser.add_argument('--workers', type=int, default=settings.OCR_SERVICE_WORKERS,
+                            help='Model-holding worker processes')
+        parser.add_argument('--max-pending', type=int, default=settings.OCR_SERVICE_MAX_PENDING,
+                            help='Requests waiting before new ones get a 503')
+        parser.add_argument('--batch-size', type=int, default=settings.OCR_BATCH_MAX_SIZE,
+                            help='Most images recognized in one batch')
+        parser.add_argument('--window-ms', type=int, default=settings.OCR_BATCH_WINDOW_MS,
+                            help='How long a batch waits for more images')
+
+    def handle(self, *args, **options):
+        # The service runs EasyOCR itself; its workers must never call out to a service
+        os.environ['OCR_SERVICE_URL'] = ''
+        settings.OCR_SERVICE_URL = ''
+
+        service = OCRService(
+            workers=options['workers'],
+            max_pending=options['max_pending'],
+            max_batch_size=options['batch_size'],
+            window_seconds=options['window_ms'] / 1000,
+        )
+        self.stdout.write(f"Loading OCR models in {options['workers']} worker processes...")
+        service.warm_up()
+
+        server = make_server(options['url'], service)
+        self.stdout.write(self.style.SUCCESS(f"OCR service listening on {options['url']}"))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            service.shutdown()
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-18 03:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prescriptions', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='prescriptionimage',
+            name='ocr_engine',
+            field=models.CharField(blank=True, max_length=20, null=True),
+        ),
+        migrations.AddField(
+            model_name='prescriptionimage',
+            name='ocr_path',
+            field=models.CharField(blank=True, max_length=30, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prescriptions', '0002_prescriptionimage_ocr_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='prescriptionimage',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:01
+
+from django.db import migrations, models
+
+
+def mark_processed_images_completed(apps, schema_editor):
+    # Images OCR'd before per-image tracking existed shouldn't be redone
+    PrescriptionImage = apps.get_model('prescriptions', 'PrescriptionImage')
+    PrescriptionImage.objects.filter(extracted_text__isnull=False).update(processing_status='completed')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prescriptions', '0003_prescriptionimage_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='prescriptionimage',
+            name='processing_error',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='prescriptionimage',
+            name='processing_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('completed', 'Completed'), ('failed', 'Failed')], default='pending', max_length=20),
+        ),
+        migrations.RunPython(mark_processed_images_completed, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prescriptions', '0004_prescriptionimage_processing_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='prescriptionimage',
+            name='page_number',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
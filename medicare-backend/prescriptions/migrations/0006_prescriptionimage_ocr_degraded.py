@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prescriptions', '0005_prescriptionimage_page_number'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='prescriptionimage',
+            name='ocr_degraded',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prescriptions', '0006_prescriptionimage_ocr_degraded'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='prescriptionimage',
+            name='compression_ratio',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 05:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prescriptions', '0008_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='uploadsession',
+            name='status',
+            field=models.CharField(choices=[('open', 'Open'), ('finalizing', 'Finalizing'), ('completed', 'Completed')], default='open', max_length=20),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 05:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prescriptions', '0009_uploadsession_finalizing'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='prescriptionimage',
+            name='ocr_roi_reduction',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -1,8 +1,11 @@
 import os
 import uuid
+from datetime import timedelta
+from django.conf import settings
 from django.db import models
 from django.contrib.auth import get_user_model
 from django.core.validators import FileExtensionValidator
+from django.utils import timezone
 from PIL import Image
 
 User = get_user_model()
@@ -12,7 +15,7 @@ def prescription_upload_path(instance, filename):
     """Generate upload path for prescription images"""
     ext = filename.split('.')[-1]
     filename = f"{uuid.uuid4()}.{ext}"
-    return os.path.join('prescriptions', str(instance.user.id), filename)
+    return os.path.join('prescriptions', str(instance.prescription.user.id), filename)
 
 
 class Prescription(models.Model):
@@ -61,22 +64,43 @@ class PrescriptionImage(models.Model):
     )
     compressed_image = models.ImageField(upload_to=prescription_upload_path, blank=True, null=True)
     processed_image = models.ImageField(upload_to=prescription_upload_path, blank=True, null=True)
+    page_number = models.PositiveIntegerField(blank=True, null=True)  # page of an uploaded PDF
     
     # OCR Results
     extracted_text = models.TextField(blank=True, null=True)
     confidence_score = models.FloatField(default=0.0)
+    ocr_engine = models.CharField(max_length=20, blank=True, null=True)
+    ocr_path = models.CharField(max_length=30, blank=True, null=True)
+    ocr_degraded = models.BooleanField(default=False)  # OCR budget ran out before every engine ran
+    ocr_roi_reduction = models.FloatField(blank=True, null=True)  # Share of pixels text-region cropping kept from Tesseract
     
     # Image metadata
     file_size = models.IntegerField(default=0)  # in bytes
+    compression_ratio = models.FloatField(blank=True, null=True)  # original bytes / compressed bytes
     width = models.IntegerField(default=0)
     height = models.IntegerField(default=0)
     format = models.CharField(max_length=10, blank=True, null=True)
+    content_hash = models.CharField(max_length=64, blank=True, null=True, db_index=True)  # SHA-256 of original
+    
+    # Each image is processed by its own task, so failures are tracked per image
+    processing_status = models.CharField(
+        max_length=20,
+        choices=[
+            ('pending', 'Pending'),
+            ('processing', 'Processing'),
+            ('completed', 'Completed'),
+            ('failed', 'Failed'),
+        ],
+        default='pending'
+    )
+    processing_error = models.TextField(blank=True, null=True)
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def save(self, *args, **kwargs):
-        if self.original_image:
+        # The processing pipeline fills metadata from its own decode; PDFs wait to be rasterized
+        if self.original_image and self.format != 'PDF' and not (self.width and self.height and self.format):
             # Get image metadata
             img = Image.open(self.original_image)
             self.width, self.height = img.size
@@ -149,3 +173,40 @@ class PrescriptionAnalytics(models.Model):
         self.total_savings = total_savings
         
         self.save()
+
+
+class UploadSession(models.Model):
+    """Resumable upload of a prescription's files, sent as offset-addressed chunks"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    files = models.JSONField(default=list)  # [{'name', 'size', 'content_type'}], in upload order
+    metadata = models.JSONField(default=dict)  # prescription fields, validated again on finalize
+    status = models.CharField(
+        max_length=20,
+        choices=[
+            ('open', 'Open'),
+            ('finalizing', 'Finalizing'),
+            ('completed', 'Completed'),
+        ],
+        default='open'
+    )
+    prescription = models.ForeignKey(
+        Prescription, on_delete=models.SET_NULL, blank=True, null=True, related_name='upload_sessions'
+    )
+    expires_at = models.DateTimeField(db_index=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Upload session {self.id} - {self.user.email}"
+
+    @property
+    def is_expired(self):
+        return self.expires_at <= timezone.now()
+
+    @property
+    def is_finalizing(self):
+        """Whether a finalize is running; one that outlived its timeout is taken to have died"""
+        timeout = timedelta(seconds=settings.UPLOAD_SESSION_FINALIZE_TIMEOUT_SECONDS)
+        return self.status == 'finalizing' and self.updated_at > timezone.now() - timeout
@@ -0,0 +1,76 @@
+"""
+Content-addressed cache of OCR results.
+
+Results are keyed by the SHA-256 of the original upload plus
+OCR_PIPELINE_VERSION, so re-uploads of the same photo and reprocessing of
+unchanged images skip the engines entirely. Bump OCR_PIPELINE_VERSION
+whenever a change to the pipeline should invalidate earlier results.
+Entries expire after OCR_CACHE_TIMEOUT; on Redis, least recently used keys
+are evicted first under memory pressure (see maxmemory-policy).
+"""
+import logging
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+
+def _cache_key(content_hash):
+    return f"ocr:{settings.OCR_PIPELINE_VERSION}:{content_hash}"
+
+
+def _orientation_key(content_hash):
+    # Orientation doesn't depend on the rest of the pipeline, so it isn't versioned
+    return f"ocr:orientation:{content_hash}"
+
+
+def get_cached_result(content_hash):
+    """Cached OCR result for an image hash, or None"""
+    if not content_hash or not settings.OCR_CACHE_ENABLED:
+        return None
+
+    try:
+        return caches[settings.OCR_CACHE_ALIAS].get(_cache_key(content_hash))
+    except Exception as e:
+        # A cache outage must never fail processing
+        logger.warning(f"OCR cache lookup failed for {content_hash}: {str(e)}")
+        return None
+
+
+def store_result(content_hash, result):
+    """Cache an OCR result and its derived artifacts for an image hash"""
+    if not content_hash or not settings.OCR_CACHE_ENABLED:
+        return
+
+    try:
+        caches[settings.OCR_CACHE_ALIAS].set(
+            _cache_key(content_hash), result, timeout=settings.OCR_CACHE_TIMEOUT
+        )
+    except Exception as e:
+        logger.warning(f"OCR cache store failed for {content_hash}: {str(e)}")
+
+
+def get_cached_orientation(content_hash):
+    """Cached orientation detection for an image hash, or None"""
+    if not content_hash or not settings.OCR_CACHE_ENABLED:
+        return None
+
+    try:
+        return caches[settings.OCR_CACHE_ALIAS].get(_orientation_key(content_hash))
+    except Exception as e:
+        logger.warning(f"Orientation cache lookup failed for {content_hash}: {str(e)}")
+        return None
+
+
+def store_orientation(content_hash, orientation):
+    """Cache orientation detection for an image hash"""
+    if not content_hash or not settings.OCR_CACHE_ENABLED:
+        return
+
+    try:
+        caches[settings.OCR_CACHE_ALIAS].set(
+            _orientation_key(content_hash), orientation, timeout=settings.OCR_CACHE_TIMEOUT
+        )
+    except Exception as e:
+        logger.warning(f"Orientation cache store failed for {content_hash}: {str(e)}")
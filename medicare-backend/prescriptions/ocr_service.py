@@ -0,0 +1,316 @@
+"""
+Optional OCR sidecar service.
+
+One long-lived service process owns the EasyOCR models in a pool of worker
+processes and serves web and Celery processes over localhost HTTP or a
+Unix socket, so they never import torch themselves. Requests are
+micro-batched per language set, one batch per pool process at a time;
+once OCR_SERVICE_MAX_PENDING requests are waiting, new ones get a 503.
+
+Start it with `python manage.py run_ocr_server` and point clients at it
+with OCR_SERVICE_URL (http://host:port or unix:///path/to/socket).
+Tesseract runs as its own subprocess and stays local to each caller.
+"""
+import http.client
+import io
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from django.conf import settings
+
+from .engines import MicroBatcher
+
+logger = logging.getLogger(__name__)
+
+OCR_PATH = '/v1/ocr'
+HEALTH_PATH = '/v1/health'
+
+
+class OCRServiceError(Exception):
+    """The OCR service failed or couldn't be reached"""
+
+
+class OCRServiceBusy(OCRServiceError):
+    """The OCR service turned the request away under load"""
+
+
+def parse_service_url(url):
+    """('unix', path) or ('tcp', (host, port)) for an OCR service URL"""
+    parsed = urlsplit(url)
+    if parsed.scheme == 'unix':
+        return 'unix', parsed.path
+    if parsed.scheme == 'http' and parsed.hostname:
+        return 'tcp', (parsed.hostname, parsed.port or 80)
+    raise ValueError(f"Unsupported OCR service URL: {url}")
+
+
+def encode_pixels(pixels):
+    """Pixels as .npy bytes: exact, and no encode/decode cost on either side"""
+    import numpy as np
+
+    buffer = io.BytesIO()
+    np.save(buffer, pixels, allow_pickle=False)
+    return buffer.getvalue()
+
+
+def decode_pixels(data):
+    import numpy as np
+
+    return np.load(io.BytesIO(data), allow_pickle=False)
+
+
+# Client
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTPConnection over a Unix socket"""
+
+    def __init__(self, path, timeout=None):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def _connection(timeout):
+    kind, address = parse_service_url(settings.OCR_SERVICE_URL)
+    if kind == 'unix':
+        return UnixHTTPConnection(address, timeout=timeout)
+    return http.client.HTTPConnection(*address, timeout=timeout)
+
+
+def recognize_remote(pixels, languages=None):
+    """
+    Run EasyOCR on the service and return its {'text', 'confidence',
+    'words'} result. Busy responses are retried after the service's
+    Retry-After, up to OCR_SERVICE_RETRIES times.
+    """
+    languages = ','.join(languages or settings.OCR_LANGUAGES)
+    body = encode_pixels(pixels)
+
+    for attempt in range(settings.OCR_SERVICE_RETRIES + 1):
+        connection = _connection(settings.OCR_SERVICE_TIMEOUT)
+        retry_after = 1.0
+        try:
+            connection.request(
+                'POST', f"{OCR_PATH}?languages={languages}", body=body,
+                headers={'Content-Type': 'application/x-npy'}
+            )
+            response = connection.getresponse()
+            payload = response.read()
+        except (BrokenPipeError, ConnectionResetError):
+            # A service shedding load may drop the connection before taking the whole body
+            response = None
+        except (OSError, http.client.HTTPException) as e:
+            raise OCRServiceError(f"OCR service unreachable: {str(e)}")
+        finally:
+            connection.close()
+
+        if response is not None:
+            if response.status == 200:
+                return json.loads(payload)
+            if response.status != 503:
+                raise OCRServiceError(f"OCR service returned {response.status}: {payload[:200]!r}")
+            retry_after = float(response.getheader('Retry-After', 1))
+        if attempt < settings.OCR_SERVICE_RETRIES:
+            time.sleep(retry_after)
+
+    raise OCRServiceBusy("OCR service is at capacity")
+
+
+# Server
+
+def _init_service_worker(threads):
+    """Pool process start-up: cap threads, then load the models once"""
+    from .engines import preload_engines
+    from .threads import apply_thread_budget
+
+    apply_thread_budget(threads)
+    preload_engines()
+
+
+def _run_service_batch(languages, images):
+    """Recognize a batch in a pool process; module-level so it pickles"""
+    from .engines import run_easyocr_batch
+    from .utils import ImageProcessor
+
+    processor = ImageProcessor()
+    return [processor._easyocr_results_to_data(results) for results in run_easyocr_batch(images, languages)]
+
+
+class OCRService:
+    """Process pool of EasyOCR workers behind per-language micro-batchers"""
+
+    def __init__(self, workers, max_pending, max_batch_size, window_seconds):
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        from .threads import compute_thread_budget
+
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_batch_size = max_batch_size
+        self.window_seconds = window_seconds
+        self.pending = 0
+        self.served = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self._batchers = {}
+        self.pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_service_worker,
+            initargs=(compute_thread_budget(workers),)
+        )
+
+    def warm_up(self):
+        """Start every pool process so models load before the first request"""
+        for future in [self.pool.submit(os.getpid) for _ in range(self.workers)]:
+            future.result()
+
+    def _batcher(self, key):
+        with self._lock:
+            batcher = self._batchers.get(key)
+            if batcher is None:
+                batcher = MicroBatcher(
+                    lambda images: self.pool.submit(_run_service_batch, key, images).result(),
+                    max_batch_size=self.max_batch_size,
+                    window_seconds=self.window_seconds,
+                    workers=self.workers
+                )
+                self._batchers[key] = batcher
+            return batcher
+
+    def try_acquire(self):
+        """Reserve a pending slot, or refuse once the service is full"""
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                return False
+            self.pending += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.pending -= 1
+            self.served += 1
+
+    def recognize(self, pixels, languages, timeout):
+        return self._batcher(tuple(languages or settings.OCR_LANGUAGES)).run(pixels, timeout=timeout)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'workers': self.workers,
+                'pending': self.pending,
+                'max_pending': self.max_pending,
+                'served': self.served,
+                'rejected': self.rejected,
+                'language_sets': ['+'.join(key) for key in self._batchers],
+            }
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+class OCRRequestHandler(BaseHTTPRequestHandler):
+    server_version = 'MedicareOCR/1.0'
+
+    def do_GET(self):
+        if urlsplit(self.path).path != HEALTH_PATH:
+            return self._send_json(404, {'error': 'Not found'})
+        self._send_json(200, self.server.ocr_service.stats())
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != OCR_PATH:
+            return self._send_json(404, {'error': 'Not found'})
+
+        service = self.server.ocr_service
+        if not service.try_acquire():
+            # Drain the body without keeping it; answering first would close the socket mid-send
+            # and the client would see a broken pipe instead of the 503
+            self._discard_body()
+            return self._send_json(503, {'error': 'OCR service is at capacity'}, {'Retry-After': '1'})
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            try:
+                pixels = decode_pixels(self.rfile.read(length))
+            except Exception:
+                return self._send_json(400, {'error': 'Body must be a .npy image array'})
+
+            languages = parse_qs(url.query).get('languages', [''])[0].split(',')
+            try:
+                result = service.recognize(
+                    pixels, [language for language in languages if language],
+                    timeout=settings.OCR_SERVICE_TIMEOUT
+                )
+            except FutureTimeoutError:
+                return self._send_json(504, {'error': 'OCR timed out'})
+            except Exception as e:
+                logger.error(f"OCR service error: {str(e)}")
+                return self._send_json(500, {'error': str(e)})
+
+            self._send_json(200, result)
+        finally:
+            service.release()
+
+    def _discard_body(self):
+        remaining = int(self.headers.get('Content-Length', 0))
+        while remaining > 0:
+            data = self.rfile.read(min(remaining, 64 * 1024))
+            if not data:
+                break
+            remaining -= len(data)
+
+    def _send_json(self, status_code, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # Unix socket peers have no address
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+
+class TCPHTTPServer(ThreadingHTTPServer):
+    # Bursts of callers should queue up and get a 503, not a refused connection
+    request_queue_size = 128
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def make_server(url, ocr_service):
+    """HTTP server for the OCR service, listening on a TCP or Unix socket URL"""
+    kind, address = parse_service_url(url)
+    if kind == 'unix':
+        if os.path.exists(address):
+            os.unlink(address)
+        server = UnixHTTPServer(address, OCRRequestHandler)
+    else:
+        server = TCPHTTPServer(address, OCRRequestHandler)
+    server.ocr_service = ocr_service
+    return server
@@ -0,0 +1,301 @@
+"""
+Per-image processing pipeline shared by the upload view and Celery tasks.
+"""
+import logging
+import os
+import time
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from .engines import languages_for_script
+from .imaging import DecodedImage, compute_content_hash, is_pdf, iter_pdf_pages
+from .models import PrescriptionImage
+from .ocr_cache import get_cached_orientation, get_cached_result, store_orientation, store_result
+from .renditions import generate_renditions
+from .utils import ImageProcessor
+
+logger = logging.getLogger(__name__)
+
+
+def iter_upload_images(uploads):
+    """
+    Yield (image_file, page_number) for each uploaded file. PDFs are
+    rasterized lazily, one page at a time, so every page flows through the
+    pipeline as its own image without the whole document being rendered.
+    """
+    for upload in uploads:
+        if is_pdf(upload):
+            for page_number, page_file in iter_pdf_pages(upload, dpi=settings.PDF_RASTER_DPI):
+                yield page_file, page_number
+        else:
+            yield upload, None
+
+
+def expand_pdf_uploads(prescription):
+    """
+    Replace the PDFs stored by an async upload with one PrescriptionImage
+    per rasterized page, so pages are rendered by the worker rather than
+    in the upload request. Each PDF is swapped for its pages atomically.
+    """
+    for pdf_image in prescription.images.filter(format='PDF').order_by('id'):
+        # Storage isn't transactional: page files written before a failure are removed by hand
+        page_names = []
+        try:
+            with transaction.atomic():
+                with pdf_image.original_image.open('rb') as pdf_file:
+                    for page_number, page_file in iter_pdf_pages(pdf_file, dpi=settings.PDF_RASTER_DPI):
+                        page = PrescriptionImage.objects.create(
+                            prescription=prescription,
+                            original_image=page_file,
+                            page_number=page_number,
+                            content_hash=compute_content_hash(page_file)
+                        )
+                        page_names.append(page.original_image.name)
+                
+                pdf_name = pdf_image.original_image.name
+                pdf_image.delete()
+                transaction.on_commit(lambda name=pdf_name: default_storage.delete(name))
+        except Exception:
+            for name in page_names:
+                default_storage.delete(name)
+            raise
+        
+        logger.info(f"Rasterized PDF {pdf_name} for prescription {prescription.id}")
+
+
+class PrescriptionImagePipeline:
+    """
+    Runs metadata, compression, enhancement and OCR for a PrescriptionImage
+    off a single decode of the original upload. Results are cached by image
+    hash, so known images skip decoding and the OCR engines altogether.
+    """
+    
+    def __init__(self, image_processor=None):
+        self.image_processor = image_processor or ImageProcessor()
+    
+    def create_image(self, prescription, image_file, page_number=None):
+        """
+        Store an upload as a PrescriptionImage.
+        Returns the saved image and its decoded pixels for process(), or None
+        for the pixels when the image is already in the OCR cache.
+        """
+        prescription_image = PrescriptionImage(
+            prescription=prescription,
+            original_image=image_file,
+            page_number=page_number,
+            content_hash=compute_content_hash(image_file)
+        )
+        
+        cached = get_cached_result(prescription_image.content_hash)
+        if cached:
+            decoded = None
+            self._apply_cached_metadata(prescription_image, cached)
+        else:
+            decoded = DecodedImage.from_file(image_file)
+            self._apply_metadata(prescription_image, decoded)
+        
+        prescription_image.save()
+        
+        return prescription_image, decoded
+    
+    def process(self, prescription_image, decoded=None, deadline=None, force=False):
+        """
+        Compress, enhance and OCR one image, saving the results on it.
+        OCR gets OCR_IMAGE_DEADLINE_SECONDS, capped by the overall deadline
+        (a time.time() timestamp) when one is given. force skips the OCR
+        cache, so a reprocess really runs the engines again.
+        Returns (extracted_text, confidence).
+        """
+        image_deadline = time.time() + settings.OCR_IMAGE_DEADLINE_SECONDS
+        if deadline is not None:
+            image_deadline = min(image_deadline, deadline)
+        
+        if not prescription_image.content_hash:
+            prescription_image.content_hash = compute_content_hash(prescription_image.original_image)
+        
+        if decoded is None:
+            cached = None if force else get_cached_result(prescription_image.content_hash)
+            if cached:
+                return self._apply_cached_result(prescription_image, cached)
+            
+            decoded = DecodedImage.from_file(prescription_image.original_image)
+            self._apply_metadata(prescription_image, decoded)
+        
+        # Turn sideways and upside-down photos upright before any expensive stage, noting the script
+        upright, script = self.orient(prescription_image, decoded)
+        rotated = upright is not decoded
+        decoded = upright
+        
+        # Compress image if not already done
+        if not prescription_image.compressed_image:
+            self.compress(prescription_image, decoded, rotated=rotated)
+        
+        # Enhance image for OCR if not already done
+        if not prescription_image.processed_image:
+            enhanced_image = self.image_processor.enhance_image_for_ocr(decoded)
+            if enhanced_image:
+                prescription_image.processed_image.save(
+                    f"processed_{prescription_image.id}{os.path.splitext(enhanced_image.name)[1]}",
+                    enhanced_image,
+                    save=False
+                )
+        
+        # Extract text using OCR; a previous low-confidence run means both engines are needed
+        previous_confidence = (
+            prescription_image.confidence_score
+            if prescription_image.extracted_text is not None else None
+        )
+        # The detected script picks the EasyOCR language models
+        result = self.image_processor.extract_text_detailed(
+            decoded, previous_confidence=previous_confidence, deadline=image_deadline,
+            languages=languages_for_script(script)
+        )
+        
+        prescription_image.extracted_text = result['text']
+        prescription_image.confidence_score = result['confidence']
+        prescription_image.ocr_engine = result['engine']
+        prescription_image.ocr_path = result['path']
+        prescription_image.ocr_degraded = result['degraded']
+        prescription_image.ocr_roi_reduction = result.get('roi_reduction')
+        if result['path'] == 'error':
+            prescription_image.processing_status = 'failed'
+            prescription_image.processing_error = result.get('error') or 'OCR failed'
+        else:
+            prescription_image.processing_status = 'completed'
+            prescription_image.processing_error = None
+        prescription_image.save()
+        self._generate_renditions(prescription_image)
+        
+        # Degraded results are not cached so the next upload gets a full run
+        if result['path'] != 'error' and not result['degraded']:
+            store_result(prescription_image.content_hash, {
+                'text': result['text'],
+                'confidence': result['confidence'],
+                'engine': result['engine'],
+                'path': result['path'],
+                'roi_reduction': result.get('roi_reduction'),
+                'words': result['words'],
+                'width': prescription_image.width,
+                'height': prescription_image.height,
+                'format': prescription_image.format,
+                'compressed_image': prescription_image.compressed_image.name or None,
+                'compression_ratio': prescription_image.compression_ratio,
+                'processed_image': prescription_image.processed_image.name or None,
+            })
+        
+        return result['text'], result['confidence']
+    
+    def compress(self, prescription_image, decoded, rotated=False):
+        """
+        Store the display copy. An original that is already a JPEG or WebP no
+        wider than COMPRESSION_MAX_WIDTH, and within the byte budget or smaller
+        than the encoder manages, is copied as is unless its pixels had to be
+        turned, by its EXIF orientation tag or by orientation detection.
+        """
+        original_size = prescription_image.file_size
+        extension = ImageProcessor.COMPRESSION_EXTENSIONS.get(prescription_image.format)
+        reusable = (
+            not rotated and not decoded.exif_transposed and original_size > 0
+            and extension is not None and decoded.width <= settings.COMPRESSION_MAX_WIDTH
+        )
+        
+        if reusable and original_size <= settings.COMPRESSION_TARGET_BYTES:
+            compressed_image = None
+        else:
+            compressed_image = self.image_processor.compress_image(decoded)
+            if compressed_image is None:
+                return
+            if reusable and compressed_image.size >= original_size:
+                compressed_image = None
+        
+        if compressed_image is None:
+            # A copy rather than the original's name, so deleting one never breaks the other
+            with default_storage.open(prescription_image.original_image.name) as original_file:
+                compressed_image = ContentFile(original_file.read(), name=f"compressed.{extension}")
+        
+        prescription_image.compressed_image.save(
+            f"compressed_{prescription_image.id}{os.path.splitext(compressed_image.name)[1]}",
+            compressed_image,
+            save=False
+        )
+        if original_size:
+            prescription_image.compression_ratio = round(original_size / compressed_image.size, 2)
+    
+    def orient(self, prescription_image, decoded):
+        """
+        Upright copy of the decoded image and the script detected on it
+        (None when unknown). Detection runs once per content hash, so
+        reprocessing and re-uploads reuse the earlier answer.
+        """
+        if not settings.OCR_DETECT_ORIENTATION:
+            return decoded, None
+        
+        orientation = get_cached_orientation(prescription_image.content_hash)
+        if orientation is None:
+            orientation = self.image_processor.detect_orientation(decoded)
+            store_orientation(prescription_image.content_hash, orientation)
+        
+        if orientation['rotate']:
+            decoded = decoded.rotated(orientation['rotate'])
+        return decoded, orientation.get('script')
+    
+    def _generate_renditions(self, prescription_image):
+        """Render the app's renditions now instead of on first request, when configured"""
+        if not settings.RENDITIONS_AT_INGEST:
+            return
+        try:
+            generate_renditions(prescription_image)
+        except Exception as e:
+            # The rendition endpoint renders on demand anyway
+            logger.warning(f"Error generating renditions for image {prescription_image.id}: {str(e)}")
+    
+    def _apply_metadata(self, prescription_image, decoded):
+        """Fill image metadata from the decoded buffer so save() needn't re-open the file"""
+        prescription_image.width = decoded.width
+        prescription_image.height = decoded.height
+        prescription_image.format = decoded.format
+        prescription_image.file_size = decoded.file_size or prescription_image.original_image.size
+    
+    def _apply_cached_metadata(self, prescription_image, cached):
+        prescription_image.width = cached['width']
+        prescription_image.height = cached['height']
+        prescription_image.format = cached['format']
+        prescription_image.file_size = prescription_image.original_image.size
+    
+    def _apply_cached_result(self, prescription_image, cached):
+        """Fill OCR results and derived images from a cache hit without touching the pixels"""
+        if not prescription_image.width:
+            self._apply_cached_metadata(prescription_image, cached)
+        
+        # Copy derived images still in storage; the cached files may belong to another user's upload
+        for field_name, prefix in (('compressed_image', 'compressed'), ('processed_image', 'processed')):
+            field_file = getattr(prescription_image, field_name)
+            cached_name = cached.get(field_name)
+            if not field_file and cached_name and default_storage.exists(cached_name):
+                with default_storage.open(cached_name) as cached_file:
+                    field_file.save(
+                        f"{prefix}_{prescription_image.id}{os.path.splitext(cached_name)[1]}",
+                        File(cached_file),
+                        save=False
+                    )
+                if field_name == 'compressed_image':
+                    prescription_image.compression_ratio = cached.get('compression_ratio')
+        
+        prescription_image.extracted_text = cached['text']
+        prescription_image.confidence_score = cached['confidence']
+        prescription_image.ocr_engine = cached['engine']
+        prescription_image.ocr_path = 'cache'
+        prescription_image.ocr_degraded = False
+        prescription_image.ocr_roi_reduction = cached.get('roi_reduction')
+        prescription_image.processing_status = 'completed'
+        prescription_image.processing_error = None
+        prescription_image.save()
+        self._generate_renditions(prescription_image)
+        
+        logger.info(f"OCR cache hit for image {prescription_image.id} ({prescription_image.content_hash[:12]})")
+        
+        return cached['text'], cached['confidence']
@@ -0,0 +1,124 @@
+"""
+Downscaled JPEG renditions of prescription images for the mobile app.
+
+Renditions are keyed by the image's content hash, so a file on disk never
+goes stale and clients may cache a rendition URL for good. They are built
+on first request, or at ingest with RENDITIONS_AT_INGEST, from a single
+decode of the original; JPEGs are scaled down inside the decoder (draft
+mode). Renditions are turned upright the same way as the OCR input.
+"""
+import io
+import os
+import tempfile
+
+from django.conf import settings
+from PIL import Image, ImageOps
+
+from .imaging import EXIF_ORIENTATION, DecodedImage, flatten_transparency
+from .ocr_cache import get_cached_orientation, store_orientation
+
+
+def rendition_key(prescription_image):
+    """Name shared by every rendition of the same image content"""
+    base = prescription_image.content_hash or f"image-{prescription_image.pk}"
+    return f"{base}-v{settings.RENDITION_VERSION}"
+
+
+def rendition_etag(prescription_image, name):
+    return f'"{rendition_key(prescription_image)}-{name}"'
+
+
+def rendition_path(prescription_image, name):
+    key = rendition_key(prescription_image)
+    return os.path.join(settings.RENDITION_ROOT, key[:2], f"{key}-{name}.jpg")
+
+
+def _detect_orientation(prescription_image, img):
+    """
+    Detect orientation on img for an image the OCR pipeline hasn't oriented
+    yet, caching it for the pipeline, so a rendition is never cached
+    unrotated just because OCR hasn't run
+    """
+    import numpy as np
+    from .utils import ImageProcessor
+
+    orientation = ImageProcessor().detect_orientation(DecodedImage(np.asarray(img)))
+    if prescription_image.content_hash:
+        store_orientation(prescription_image.content_hash, orientation)
+    return orientation
+
+
+def _render(prescription_image, sizes):
+    """{name: JPEG bytes} for {name: longest side}, from one decode of the original"""
+    largest = max(sizes.values())
+
+    orientation = None
+    if settings.OCR_DETECT_ORIENTATION and prescription_image.content_hash:
+        orientation = get_cached_orientation(prescription_image.content_hash)
+    detect = settings.OCR_DETECT_ORIENTATION and orientation is None
+    if detect:
+        # Large enough for detection to see what the OCR pipeline sees
+        largest = max(largest, settings.OCR_ORIENTATION_MAX_DIMENSION)
+
+    image_file = prescription_image.original_image
+    image_file.open('rb')
+    try:
+        img = Image.open(image_file)
+        width, height = img.size
+        # draft() keeps both sides at or above the requested size, so ask for the target shape
+        scale = min(1.0, largest / max(width, height))
+        img.draft('RGB', (int(width * scale), int(height * scale)))
+
+        if img.getexif().get(EXIF_ORIENTATION, 1) != 1:
+            img = ImageOps.exif_transpose(img)
+        if img.mode in ('RGBA', 'LA', 'P'):
+            img = flatten_transparency(img)
+        else:
+            img = img.convert('RGB')
+    finally:
+        image_file.close()
+
+    # Turn the rendition the way OCR finds the text to be upright
+    if detect:
+        orientation = _detect_orientation(prescription_image, img)
+    if orientation and orientation.get('rotate'):
+        img = img.rotate(-orientation['rotate'], expand=True)
+
+    renditions = {}
+    # Largest first, so each smaller rendition is scaled from the one before
+    for name, max_side in sorted(sizes.items(), key=lambda item: -item[1]):
+        img.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+        output = io.BytesIO()
+        img.save(output, format='JPEG', quality=settings.RENDITION_QUALITY, optimize=True, progressive=True)
+        renditions[name] = output.getvalue()
+    return renditions
+
+
+def _write(path, data):
+    """Write through a temp file so concurrent requests never serve a partial file"""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as temp_file:
+        temp_file.write(data)
+    os.replace(temp_path, path)
+
+
+def get_rendition(prescription_image, name):
+    """Path of the named rendition on disk, rendering it on a miss"""
+    path = rendition_path(prescription_image, name)
+    if not os.path.exists(path):
+        data = _render(prescription_image, {name: settings.PRESCRIPTION_IMAGE_RENDITIONS[name]})[name]
+        _write(path, data)
+    return path
+
+
+def generate_renditions(prescription_image):
+    """Render every rendition not on disk yet, from a single decode"""
+    sizes = {
+        name: max_side for name, max_side in settings.PRESCRIPTION_IMAGE_RENDITIONS.items()
+        if not os.path.exists(rendition_path(prescription_image, name))
+    }
+    if sizes:
+        for name, data in _render(prescription_image, sizes).items():
+            _write(rendition_path(prescription_image, name), data)
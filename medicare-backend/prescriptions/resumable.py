@@ -0,0 +1,112 @@
+"""
+Resumable uploads: a session declares its files up front, the client PUTs
+offset-addressed chunks of each, then finalizes the session into a
+Prescription through the regular upload path.
+
+Chunks are appended to one part file per upload file under
+UPLOAD_SESSION_ROOT. The part file's size is the only record of progress,
+so after a dropped connection the client asks for the offsets and resumes
+from there instead of resending everything.
+"""
+import fcntl
+import os
+import shutil
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+
+# Read size for copying request bodies to disk
+COPY_CHUNK_SIZE = 64 * 1024
+
+
+class UploadConflict(Exception):
+    """The chunk doesn't start at the file's current offset, or another chunk is being written"""
+
+    def __init__(self, message, offset):
+        super().__init__(message)
+        self.offset = offset
+
+
+class ChunkTooLarge(Exception):
+    """The chunk would take the file past its declared size"""
+
+
+def session_dir(session):
+    return os.path.join(settings.UPLOAD_SESSION_ROOT, str(session.id))
+
+
+def part_path(session, index):
+    return os.path.join(session_dir(session), f"{index}.part")
+
+
+def received_bytes(session, index):
+    """Bytes of file `index` received so far"""
+    try:
+        return os.path.getsize(part_path(session, index))
+    except FileNotFoundError:
+        return 0
+
+
+def file_offsets(session):
+    """[{'index', 'name', 'size', 'content_type', 'offset'}] for the session's files"""
+    # Parts are deleted once the upload is finalized, having been received in full
+    if session.status == 'completed':
+        return [dict(declared, index=index, offset=declared['size']) for index, declared in enumerate(session.files)]
+    return [
+        dict(declared, index=index, offset=received_bytes(session, index))
+        for index, declared in enumerate(session.files)
+    ]
+
+
+def is_complete(session):
+    return all(entry['offset'] == entry['size'] for entry in file_offsets(session))
+
+
+def append_chunk(session, index, offset, stream, length):
+    """
+    Append `length` bytes read from `stream` to file `index`, starting at
+    `offset`. Returns the new offset. Whatever arrives before the stream
+    breaks off is kept, so the next chunk resumes from there.
+    """
+    declared_size = session.files[index]['size']
+    os.makedirs(session_dir(session), exist_ok=True)
+
+    with open(part_path(session, index), 'ab') as part:
+        try:
+            fcntl.flock(part, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise UploadConflict("Another chunk of this file is being uploaded", received_bytes(session, index))
+
+        current = os.fstat(part.fileno()).st_size
+        if offset != current:
+            raise UploadConflict(f"Chunk starts at {offset} but the file is at {current}", current)
+        if current + length > declared_size:
+            raise ChunkTooLarge(f"Chunk would take the file past its declared size of {declared_size} bytes")
+
+        remaining = length
+        while remaining:
+            data = stream.read(min(COPY_CHUNK_SIZE, remaining))
+            if not data:
+                break
+            part.write(data)
+            remaining -= len(data)
+
+        part.flush()
+        return os.fstat(part.fileno()).st_size
+
+
+def open_uploads(session):
+    """The completed files as UploadedFiles, in the order they were declared"""
+    return [
+        UploadedFile(
+            file=open(part_path(session, index), 'rb'),
+            name=declared['name'],
+            content_type=declared['content_type'],
+            size=declared['size']
+        )
+        for index, declared in enumerate(session.files)
+    ]
+
+
+def delete_parts(session):
+    shutil.rmtree(session_dir(session), ignore_errors=True)
@@ -1,21 +1,46 @@
+from django.conf import settings
+from django.urls import reverse
+from PIL import Image
 from rest_framework import serializers
-from .models import Prescription, PrescriptionImage, Medicine, PrescriptionAnalytics
+from .imaging import is_pdf, pdf_page_sizes
+from .models import Prescription, PrescriptionImage, Medicine, PrescriptionAnalytics, UploadSession
+from .resumable import file_offsets
+
+
+ALLOWED_UPLOAD_TYPES = ['image/jpeg', 'image/jpg', 'image/png', 'application/pdf']
+
+
+def rendition_url(prescription_image, name, request=None):
+    """URL of an image rendition; the version query lets clients cache it for good"""
+    url = reverse('prescription-image-rendition', kwargs={'pk': prescription_image.pk, 'rendition': name})
+    url = f"{url}?v={settings.RENDITION_VERSION}"
+    return request.build_absolute_uri(url) if request else url
 
 
 class PrescriptionImageSerializer(serializers.ModelSerializer):
     """Serializer for prescription images"""
+    renditions = serializers.SerializerMethodField()
     
     class Meta:
         model = PrescriptionImage
         fields = [
-            'id', 'original_image', 'compressed_image', 'processed_image',
-            'extracted_text', 'confidence_score', 'file_size', 'width', 
-            'height', 'format', 'created_at'
+            'id', 'original_image', 'compressed_image', 'processed_image', 'renditions',
+            'page_number', 'extracted_text', 'confidence_score', 'ocr_engine', 'ocr_path',
+            'ocr_degraded', 'ocr_roi_reduction', 'file_size', 'compression_ratio', 'width',
+            'height', 'format', 'content_hash', 'processing_status', 'created_at'
         ]
         read_only_fields = [
-            'compressed_image', 'processed_image', 'extracted_text', 
-            'confidence_score', 'file_size', 'width', 'height', 'format'
+            'compressed_image', 'processed_image', 'page_number', 'extracted_text', 
+            'confidence_score', 'ocr_engine', 'ocr_path', 'ocr_degraded', 'ocr_roi_reduction',
+            'file_size', 'compression_ratio', 'width', 'height', 'format', 'content_hash', 'processing_status'
         ]
+    
+    def get_renditions(self, obj):
+        # A stored PDF has no pixels until the worker replaces it with its pages
+        if obj.format == 'PDF':
+            return {}
+        request = self.context.get('request')
+        return {name: rendition_url(obj, name, request) for name in settings.PRESCRIPTION_IMAGE_RENDITIONS}
 
 
 class MedicineSerializer(serializers.ModelSerializer):
@@ -73,17 +98,27 @@ class PrescriptionListSerializer(serializers.ModelSerializer):
     total_medicines = serializers.ReadOnlyField()
     estimated_total_cost = serializers.ReadOnlyField()
     image_count = serializers.SerializerMethodField()
+    thumbnail = serializers.SerializerMethodField()
     
     class Meta:
         model = Prescription
         fields = [
             'id', 'title', 'doctor_name', 'hospital_name', 'prescription_date',
             'created_at', 'processing_status', 'total_medicines', 
-            'estimated_total_cost', 'image_count'
+            'estimated_total_cost', 'image_count', 'thumbnail'
         ]
     
     def get_image_count(self, obj):
         return obj.images.count()
+    
+    def get_thumbnail(self, obj):
+        """Thumbnail rendition of the first image, so lists never fetch full images"""
+        # The list view prefetches the images in page order
+        images = obj.images.all()
+        first_image = images[0] if images else None
+        if first_image is None or first_image.format == 'PDF':
+            return None
+        return rendition_url(first_image, 'thumbnail', self.context.get('request'))
 
 
 class PrescriptionAnalyticsSerializer(serializers.ModelSerializer):
@@ -99,33 +134,149 @@ class PrescriptionAnalyticsSerializer(serializers.ModelSerializer):
 
 class PrescriptionUploadSerializer(serializers.Serializer):
     """Serializer for prescription upload"""
+    # FileField rather than ImageField: PIL can't open PDFs, which are
+    # checked separately in validate_images
     images = serializers.ListField(
-        child=serializers.ImageField(),
+        child=serializers.FileField(),
         min_length=1,
         max_length=10,
-        help_text="Upload 1-10 prescription images"
+        help_text="Upload 1-10 prescription images or PDFs"
     )
     title = serializers.CharField(max_length=200, required=False)
     description = serializers.CharField(required=False)
     doctor_name = serializers.CharField(max_length=100, required=False)
     hospital_name = serializers.CharField(max_length=200, required=False)
     prescription_date = serializers.DateField(required=False)
+    process_async = serializers.BooleanField(
+        required=False,
+        allow_null=True,
+        help_text="Return 202 right away and run OCR in the background"
+    )
     
     def validate_images(self, value):
         """Validate uploaded images"""
         for image in value:
-            # Check file size (max 10MB per image)
-            if image.size > 10 * 1024 * 1024:
+            # Check file size (uploads through PrescriptionUploadHandler are cut off earlier)
+            if image.size > settings.PRESCRIPTION_MAX_FILE_BYTES:
                 raise serializers.ValidationError(
-                    f"Image {image.name} is too large. Maximum size is 10MB."
+                    f"Image {image.name} is too large. "
+                    f"Maximum size is {settings.PRESCRIPTION_MAX_FILE_BYTES // (1024 * 1024)}MB."
                 )
             
             # Check file type
-            allowed_types = ['image/jpeg', 'image/jpg', 'image/png', 'application/pdf']
-            if hasattr(image, 'content_type') and image.content_type not in allowed_types:
+            if hasattr(image, 'content_type') and image.content_type not in ALLOWED_UPLOAD_TYPES:
                 raise serializers.ValidationError(
                     f"Image {image.name} has unsupported format. "
                     f"Allowed formats: JPEG, PNG, PDF"
                 )
+            
+            if is_pdf(image):
+                self._validate_pdf(image)
+            else:
+                self._validate_image_file(image)
+                if settings.OCR_QUALITY_GATE:
+                    self._validate_image_quality(image)
         
         return value
+    
+    def _validate_image_file(self, image):
+        """Check the file really is an image, as ImageField would"""
+        try:
+            Image.open(image).verify()
+        except Exception:
+            raise serializers.ValidationError(
+                f"Image {image.name} is not a valid image file."
+            )
+        finally:
+            image.seek(0)
+    
+    def _validate_image_quality(self, image):
+        """Reject photos OCR won't be able to read, saying how to retake them"""
+        from .utils import ImageProcessor
+        
+        problems = ImageProcessor().assess_quality(image)
+        if problems:
+            raise serializers.ValidationError(
+                [f"Image {image.name} {problem}." for problem in problems]
+            )
+    
+    def _validate_pdf(self, pdf):
+        """Check the PDF opens and stays within the page count and page size limits"""
+        try:
+            page_sizes = pdf_page_sizes(pdf)
+        except Exception:
+            raise serializers.ValidationError(
+                f"File {pdf.name} is not a readable PDF."
+            )
+        finally:
+            pdf.seek(0)
+        
+        if not page_sizes or len(page_sizes) > settings.PRESCRIPTION_MAX_PDF_PAGES:
+            raise serializers.ValidationError(
+                f"PDF {pdf.name} must have between 1 and "
+                f"{settings.PRESCRIPTION_MAX_PDF_PAGES} pages."
+            )
+        
+        # At one pixel per point these are far beyond any prescription page
+        for width, height in page_sizes:
+            if width * height > settings.PDF_MAX_PAGE_PIXELS:
+                raise serializers.ValidationError(
+                    f"PDF {pdf.name} has a page too large to process."
+                )
+
+
+class UploadSessionFileSerializer(serializers.Serializer):
+    """A file declared when a resumable upload session is created"""
+    name = serializers.CharField(max_length=255)
+    size = serializers.IntegerField(min_value=1)
+    content_type = serializers.CharField(max_length=100)
+    
+    def validate(self, attrs):
+        if attrs['size'] > settings.PRESCRIPTION_MAX_FILE_BYTES:
+            raise serializers.ValidationError(
+                f"Image {attrs['name']} is too large. "
+                f"Maximum size is {settings.PRESCRIPTION_MAX_FILE_BYTES // (1024 * 1024)}MB."
+            )
+        if attrs['content_type'] not in ALLOWED_UPLOAD_TYPES:
+            raise serializers.ValidationError(
+                f"Image {attrs['name']} has unsupported format. "
+                f"Allowed formats: JPEG, PNG, PDF"
+            )
+        return attrs
+
+
+class UploadSessionCreateSerializer(PrescriptionUploadSerializer):
+    """
+    Opens a resumable upload: the files are declared here and sent later in
+    chunks. The prescription fields are the upload endpoint's, and are
+    validated again with the files on finalize.
+    """
+    images = None
+    files = serializers.ListField(
+        child=UploadSessionFileSerializer(),
+        min_length=1,
+        max_length=10,
+        help_text="Name, size and content type of the 1-10 images or PDFs to upload"
+    )
+    
+    def validate_files(self, value):
+        total_size = sum(declared['size'] for declared in value)
+        if total_size > settings.PRESCRIPTION_MAX_UPLOAD_BYTES:
+            raise serializers.ValidationError(
+                f"Upload is too large. Maximum total size is "
+                f"{settings.PRESCRIPTION_MAX_UPLOAD_BYTES // (1024 * 1024)}MB."
+            )
+        return value
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    """Resumable upload session, with how far each file has got"""
+    files = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'status', 'files', 'prescription', 'expires_at', 'created_at']
+        read_only_fields = fields
+    
+    def get_files(self, obj):
+        return file_offsets(obj)
@@ -1,4 +1,7 @@
-from celery import shared_task
+import time
+
+from celery import chord, shared_task
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from .models import Prescription, PrescriptionImage, Medicine
 import logging
@@ -9,63 +12,101 @@ logger = logging.getLogger(__name__)
 
 
 @shared_task
-def process_prescription_images(prescription_id):
+def process_prescription_images(prescription_id, force=False):
     """
-    Background task to process prescription images
+    Background task to process prescription images.
+    Fans out one task per image and merges the results in
+    finalize_prescription once every image task has finished.
+    All image tasks share one OCR deadline for the prescription.
     """
     try:
         prescription = Prescription.objects.get(id=prescription_id)
         prescription.processing_status = 'processing'
         prescription.save()
         
-        from .utils import ImageProcessor, MedicineExtractor
-        image_processor = ImageProcessor()
+        # PDFs from async uploads are rasterized here, off the request path
+        from .pipeline import expand_pdf_uploads
+        expand_pdf_uploads(prescription)
+        
+        image_ids = list(prescription.images.order_by('id').values_list('id', flat=True))
+        
+        if not image_ids:
+            return finalize_prescription([], prescription_id)
+        
+        deadline = time.time() + settings.OCR_PRESCRIPTION_DEADLINE_SECONDS
+        chord(
+            process_prescription_image.s(image_id, force=force, deadline=deadline)
+            for image_id in image_ids
+        )(finalize_prescription.s(prescription_id))
+        
+        logger.info(f"Queued {len(image_ids)} images for prescription {prescription_id}")
+        return f"Queued {len(image_ids)} images for prescription {prescription_id}"
+        
+    except Prescription.DoesNotExist:
+        logger.error(f"Prescription {prescription_id} not found")
+        return f"Prescription {prescription_id} not found"
+        
+    except Exception as e:
+        logger.error(f"Error processing prescription {prescription_id}: {str(e)}")
+        
+        # Update prescription status to failed
+        Prescription.objects.filter(id=prescription_id).update(processing_status='failed')
+        
+        return f"Error processing prescription {prescription_id}: {str(e)}"
+
+
+@shared_task
+def process_prescription_image(image_id, force=False, deadline=None):
+    """
+    Background task to process a single prescription image.
+    Idempotent: images that already completed are skipped unless forced.
+    Never raises, so one bad page can't break the chord for the others.
+    """
+    try:
+        prescription_image = PrescriptionImage.objects.get(id=image_id)
+    except PrescriptionImage.DoesNotExist:
+        logger.error(f"Prescription image {image_id} not found")
+        return {'image_id': image_id, 'status': 'missing'}
+    
+    if prescription_image.processing_status == 'completed' and not force:
+        return {'image_id': image_id, 'status': 'completed'}
+    
+    try:
+        PrescriptionImage.objects.filter(id=image_id).update(processing_status='processing')
+        
+        from .pipeline import PrescriptionImagePipeline
+        PrescriptionImagePipeline().process(prescription_image, deadline=deadline, force=force)
+        
+        # OCR errors are recorded on the image rather than raised
+        return {'image_id': image_id, 'status': prescription_image.processing_status}
+        
+    except Exception as e:
+        logger.error(f"Error processing image {image_id}: {str(e)}")
+        PrescriptionImage.objects.filter(id=image_id).update(
+            processing_status='failed',
+            processing_error=str(e)
+        )
+        return {'image_id': image_id, 'status': 'failed'}
+
+
+@shared_task
+def finalize_prescription(image_results, prescription_id):
+    """
+    Chord callback: extract medicines from the merged text of all
+    completed images and settle the prescription's status
+    """
+    try:
+        prescription = Prescription.objects.get(id=prescription_id)
+        
+        from .utils import MedicineExtractor
         medicine_extractor = MedicineExtractor()
         
-        all_extracted_text = []
-        
-        # Process each image
-        for prescription_image in prescription.images.all():
-            try:
-                # Compress image if not already done
-                if not prescription_image.compressed_image:
-                    compressed_image = image_processor.compress_image(
-                        prescription_image.original_image
-                    )
-                    if compressed_image:
-                        prescription_image.compressed_image.save(
-                            f"compressed_{prescription_image.id}.jpg",
-                            compressed_image,
-                            save=False
-                        )
-                
-                # Enhance image for OCR if not already done
-                if not prescription_image.processed_image:
-                    enhanced_image = image_processor.enhance_image_for_ocr(
-                        prescription_image.original_image
-                    )
-                    if enhanced_image:
-                        prescription_image.processed_image.save(
-                            f"processed_{prescription_image.id}.jpg",
-                            enhanced_image,
-                            save=False
-                        )
-                
-                # Extract text using OCR
-                extracted_text, confidence = image_processor.extract_text_combined(
-                    prescription_image.original_image
-                )
-                
-                prescription_image.extracted_text = extracted_text
-                prescription_image.confidence_score = confidence
-                prescription_image.save()
-                
-                if extracted_text:
-                    all_extracted_text.append(extracted_text)
-                
-            except Exception as e:
-                logger.error(f"Error processing image {prescription_image.id}: {str(e)}")
-                continue
+        images = list(prescription.images.order_by('id'))
+        all_extracted_text = [
+            image.extracted_text for image in images
+            if image.processing_status == 'completed' and image.extracted_text
+        ]
+        failed_count = sum(1 for image in images if image.processing_status == 'failed')
         
         # Extract medicines from all text
         if all_extracted_text:
@@ -82,9 +123,12 @@ def process_prescription_images(prescription_id):
                     **med_data
                 )
         
-        # Update prescription status
-        prescription.is_processed = True
-        prescription.processing_status = 'completed'
+        # The prescription only fails if none of its images could be processed
+        if images and failed_count == len(images):
+            prescription.processing_status = 'failed'
+        else:
+            prescription.is_processed = True
+            prescription.processing_status = 'completed'
         prescription.save()
         
         # Update user analytics
@@ -94,7 +138,10 @@ def process_prescription_images(prescription_id):
         )
         analytics.update_analytics()
         
-        logger.info(f"Successfully processed prescription {prescription_id}")
+        logger.info(
+            f"Finished prescription {prescription_id}: "
+            f"{len(images) - failed_count}/{len(images)} images processed"
+        )
         return f"Prescription {prescription_id} processed successfully"
         
     except Prescription.DoesNotExist:
@@ -102,16 +149,8 @@ def process_prescription_images(prescription_id):
         return f"Prescription {prescription_id} not found"
         
     except Exception as e:
-        logger.error(f"Error processing prescription {prescription_id}: {str(e)}")
-        
-        # Update prescription status to failed
-        try:
-            prescription = Prescription.objects.get(id=prescription_id)
-            prescription.processing_status = 'failed'
-            prescription.save()
-        except:
-            pass
-        
+        logger.error(f"Error finalizing prescription {prescription_id}: {str(e)}")
+        Prescription.objects.filter(id=prescription_id).update(processing_status='failed')
         return f"Error processing prescription {prescription_id}: {str(e)}"
 
 
@@ -139,6 +178,26 @@ def update_user_analytics(user_id):
         return f"Error updating analytics for user {user_id}: {str(e)}"
 
 
+@shared_task
+def cleanup_expired_upload_sessions():
+    """
+    Delete expired resumable upload sessions along with their chunks on disk
+    """
+    from django.utils import timezone
+    from .models import UploadSession
+    from .resumable import delete_parts
+    
+    expired = UploadSession.objects.filter(expires_at__lte=timezone.now())
+    count = 0
+    for session in expired.iterator():
+        delete_parts(session)
+        count += 1
+    expired.delete()
+    
+    logger.info(f"Deleted {count} expired upload sessions")
+    return f"Deleted {count} expired upload sessions"
+
+
 @shared_task
 def cleanup_old_prescription_images():
     """
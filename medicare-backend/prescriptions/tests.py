@@ -0,0 +1,397 @@
+"""
+Behavioural tests for the prescription upload, resumable upload and
+rendition endpoints and the Celery processing pipeline. The OCR engines are
+mocked, so neither Tesseract nor the EasyOCR models are needed.
+"""
+import hashlib
+import io
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from django.utils import timezone
+from PIL import Image, ImageDraw, ImageFont
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from medicare_backend.celery import app as celery_app
+from .models import Prescription, PrescriptionImage, UploadSession
+from .pipeline import PrescriptionImagePipeline
+from .tasks import finalize_prescription, process_prescription_images
+from .utils import ImageProcessor
+
+User = get_user_model()
+
+API = '/api/prescriptions'
+PRESCRIPTION_TEXT = 'Tab Paracetamol 500mg twice daily'
+
+
+def prescription_photo():
+    """JPEG bytes of a sharp, well-lit page of text that passes the quality gate"""
+    image = Image.new('RGB', (1600, 900), 'white')
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=32)
+    for line in range(8):
+        draw.text((20, 20 + line * 60), PRESCRIPTION_TEXT, fill='black', font=font)
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+def jpeg_upload(data, name='prescription.jpg'):
+    return SimpleUploadedFile(name, data, content_type='image/jpeg')
+
+
+class OCRTestCase(APITestCase):
+    """
+    Media, renditions and upload sessions go to a temporary directory and the
+    OCR cache to local memory. Tesseract reads PRESCRIPTION_TEXT; EasyOCR
+    finds nothing, so tiered OCR settles on Tesseract.
+    """
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        overrides = override_settings(
+            MEDIA_ROOT=media_root,
+            RENDITION_ROOT=f"{media_root}/renditions",
+            UPLOAD_SESSION_ROOT=f"{media_root}/upload_sessions",
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+            OCR_CACHE_ALIAS='default',
+            OCR_SERVICE_URL='',
+            OCR_EASYOCR_BATCHING=False,
+            PRESCRIPTION_ASYNC_UPLOAD=False,
+            RENDITIONS_AT_INGEST=False,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        # Local-memory caches outlive the override; start every test cold
+        caches['default'].clear()
+
+        self.tesseract = self._patch(
+            ImageProcessor, 'extract_tesseract_data',
+            side_effect=lambda image, timeout=0: {'text': PRESCRIPTION_TEXT, 'confidence': 90.0, 'words': []}
+        )
+        self.easyocr = self._patch(
+            ImageProcessor, 'extract_easyocr_data',
+            side_effect=lambda image, languages=None: {'text': '', 'confidence': 0.0, 'words': []}
+        )
+        self._patch(
+            ImageProcessor, 'detect_orientation',
+            return_value={'rotate': 0, 'script': None, 'confidence': 0.0}
+        )
+        self._patch(ImageProcessor, 'detect_easyocr_text', return_value=None)
+
+        self.user = User.objects.create_user(email='patient@example.com', password='password')
+        self.client.force_authenticate(self.user)
+
+    def _patch(self, target, attribute, **kwargs):
+        patcher = mock.patch.object(target, attribute, **kwargs)
+        self.addCleanup(patcher.stop)
+        return patcher.start()
+
+    def upload(self, *files, **fields):
+        return self.client.post(f"{API}/upload/", {'images': list(files), **fields}, format='multipart')
+
+
+class PrescriptionUploadTests(OCRTestCase):
+
+    def test_sync_upload_runs_ocr_and_extracts_medicines(self):
+        response = self.upload(jpeg_upload(prescription_photo()), title='Fever', process_async=False)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        prescription = Prescription.objects.get(id=response.data['data']['id'])
+        self.assertEqual(prescription.processing_status, 'completed')
+        image = prescription.images.get()
+        self.assertEqual(image.processing_status, 'completed')
+        self.assertEqual(image.extracted_text, PRESCRIPTION_TEXT)
+        self.assertEqual(image.ocr_engine, 'tesseract')
+        self.assertEqual(list(prescription.medicines.values_list('dosage', flat=True)), ['500mg'])
+
+    def test_known_image_is_served_from_ocr_cache(self):
+        data = prescription_photo()
+        self.upload(jpeg_upload(data), process_async=False)
+        self.tesseract.reset_mock()
+
+        response = self.upload(jpeg_upload(data), process_async=False)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['data']['images'][0]['ocr_path'], 'cache')
+        self.tesseract.assert_not_called()
+
+    def test_async_upload_stores_images_and_queues_processing(self):
+        data = prescription_photo()
+        with mock.patch('prescriptions.views.process_prescription_images.delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.upload(jpeg_upload(data), process_async=True)
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response['Location'], response.data['status_url'])
+        prescription = Prescription.objects.get(id=response.data['data']['id'])
+        self.assertEqual(prescription.processing_status, 'pending')
+        delay.assert_called_once_with(prescription.id)
+        self.tesseract.assert_not_called()
+        # Hashed by the streaming upload handler as the bytes arrived
+        self.assertEqual(prescription.images.get().content_hash, hashlib.sha256(data).hexdigest())
+
+    def test_quality_gate_rejects_unreadable_photo(self):
+        blank = io.BytesIO()
+        Image.new('RGB', (1600, 900), 'gray').save(blank, 'JPEG')
+
+        response = self.upload(jpeg_upload(blank.getvalue(), 'blank.jpg'), process_async=False)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('blank.jpg', response.data['images'][0])
+        self.assertFalse(Prescription.objects.exists())
+        self.tesseract.assert_not_called()
+
+    def test_streaming_handler_stops_oversized_file(self):
+        with override_settings(PRESCRIPTION_MAX_FILE_BYTES=10 * 1024):
+            response = self.upload(jpeg_upload(prescription_photo(), 'large.jpg'), process_async=False)
+
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.assertIn('large.jpg is too large', response.data['images'][0])
+        self.assertFalse(Prescription.objects.exists())
+
+
+class UploadSessionTests(OCRTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.data = prescription_photo()
+
+    def create_session(self, *sizes):
+        files = [
+            {'name': f'page{index}.jpg', 'size': size, 'content_type': 'image/jpeg'}
+            for index, size in enumerate(sizes or [len(self.data)])
+        ]
+        response = self.client.post(
+            f"{API}/uploads/", {'title': 'Resumed', 'process_async': False, 'files': files},
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data['id']
+
+    def put_chunk(self, session_id, index, offset, chunk):
+        return self.client.put(
+            f"{API}/uploads/{session_id}/files/{index}/", data=chunk,
+            content_type='application/offset+octet-stream', HTTP_UPLOAD_OFFSET=str(offset)
+        )
+
+    def finalize(self, session_id):
+        return self.client.post(f"{API}/uploads/{session_id}/finalize/")
+
+    def file_offsets(self, session_id):
+        response = self.client.get(f"{API}/uploads/{session_id}/")
+        return [declared['offset'] for declared in response.data['files']]
+
+    def test_upload_resumes_from_reported_offset(self):
+        session_id = self.create_session()
+
+        response = self.put_chunk(session_id, 0, 0, self.data[:20000])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Upload-Offset'], '20000')
+        # After a dropped connection the client asks where to carry on
+        self.assertEqual(self.file_offsets(session_id), [20000])
+
+        response = self.put_chunk(session_id, 0, 20000, self.data[20000:])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.file_offsets(session_id), [len(self.data)])
+
+    def test_chunk_at_wrong_offset_is_conflict(self):
+        session_id = self.create_session()
+        self.put_chunk(session_id, 0, 0, self.data[:20000])
+
+        response = self.put_chunk(session_id, 0, 0, self.data[:20000])
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['offset'], 20000)
+        self.assertEqual(self.file_offsets(session_id), [20000])
+
+    def test_chunk_past_declared_size_is_rejected(self):
+        session_id = self.create_session()
+
+        response = self.put_chunk(session_id, 0, 0, self.data + b'extra')
+
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.assertEqual(self.file_offsets(session_id), [0])
+
+    def test_finalize_incomplete_upload_is_conflict(self):
+        session_id = self.create_session()
+        self.put_chunk(session_id, 0, 0, self.data[:20000])
+
+        response = self.finalize(session_id)
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['files'][0]['offset'], 20000)
+        self.assertFalse(Prescription.objects.exists())
+
+    def test_finalize_is_idempotent(self):
+        session_id = self.create_session()
+        self.put_chunk(session_id, 0, 0, self.data)
+
+        first = self.finalize(session_id)
+        second = self.finalize(session_id)
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.data['data']['id'], first.data['data']['id'])
+        self.assertEqual(Prescription.objects.count(), 1)
+        self.assertEqual(Prescription.objects.get().title, 'Resumed')
+        # The chunks are gone, but the files were received in full
+        self.assertEqual(self.file_offsets(session_id), [len(self.data)])
+        self.assertEqual(self.put_chunk(session_id, 0, 0, b'x').status_code, status.HTTP_409_CONFLICT)
+
+    def test_finalize_in_progress_is_conflict_until_it_times_out(self):
+        session_id = self.create_session()
+        self.put_chunk(session_id, 0, 0, self.data)
+        UploadSession.objects.filter(id=session_id).update(status='finalizing', updated_at=timezone.now())
+
+        self.assertEqual(self.finalize(session_id).status_code, status.HTTP_409_CONFLICT)
+
+        UploadSession.objects.filter(id=session_id).update(updated_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(self.finalize(session_id).status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Prescription.objects.count(), 1)
+
+    def test_invalid_upload_reopens_session(self):
+        session_id = self.create_session(5)
+        self.put_chunk(session_id, 0, 0, b'hello')
+
+        response = self.finalize(session_id)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(UploadSession.objects.get(id=session_id).status, 'open')
+        self.assertFalse(Prescription.objects.exists())
+
+    def test_expired_session_is_gone(self):
+        session_id = self.create_session()
+        UploadSession.objects.filter(id=session_id).update(expires_at=timezone.now() - timedelta(hours=1))
+
+        response = self.put_chunk(session_id, 0, 0, self.data)
+
+        self.assertEqual(response.status_code, status.HTTP_410_GONE)
+
+    def test_sessions_are_private_to_their_user(self):
+        session_id = self.create_session()
+        self.client.force_authenticate(User.objects.create_user(email='other@example.com', password='password'))
+
+        self.assertEqual(self.client.get(f"{API}/uploads/{session_id}/").status_code, status.HTTP_404_NOT_FOUND)
+
+
+class RenditionTests(OCRTestCase):
+
+    def setUp(self):
+        super().setUp()
+        response = self.upload(jpeg_upload(prescription_photo()), process_async=False)
+        self.image = PrescriptionImage.objects.get(id=response.data['data']['images'][0]['id'])
+
+    def get_rendition(self, image_id, rendition, **headers):
+        return self.client.get(f"{API}/images/{image_id}/renditions/{rendition}/", HTTP_ACCEPT='image/*', **headers)
+
+    def test_rendition_is_a_cacheable_jpeg(self):
+        response = self.get_rendition(self.image.id, 'thumbnail')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertIn('immutable', response['Cache-Control'])
+        thumbnail = Image.open(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertLessEqual(thumbnail.width, self.image.width)
+
+    def test_matching_etag_is_not_modified(self):
+        etag = self.get_rendition(self.image.id, 'thumbnail')['ETag']
+
+        response = self.get_rendition(self.image.id, 'thumbnail', HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_unknown_rendition_is_not_found(self):
+        self.assertEqual(self.get_rendition(self.image.id, 'poster').status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_stored_pdf_has_no_renditions(self):
+        pdf = PrescriptionImage.objects.create(
+            prescription=self.image.prescription,
+            original_image=SimpleUploadedFile('scan.pdf', b'%PDF-1.4', content_type='application/pdf'),
+            format='PDF'
+        )
+
+        self.assertEqual(self.get_rendition(pdf.id, 'thumbnail').status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_other_users_images_are_not_found(self):
+        self.client.force_authenticate(User.objects.create_user(email='other@example.com', password='password'))
+
+        self.assertEqual(self.get_rendition(self.image.id, 'thumbnail').status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_list_links_thumbnails(self):
+        response = self.client.get(f"{API}/prescriptions/")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(f"/images/{self.image.id}/renditions/thumbnail/", response.data['results'][0]['thumbnail'])
+
+
+class ProcessingTaskTests(OCRTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.prescription = Prescription.objects.create(user=self.user, title='Queued', processing_status='pending')
+        # The chord runs its image tasks and callback in this process
+        always_eager = celery_app.conf.task_always_eager
+        celery_app.conf.task_always_eager = True
+        self.addCleanup(setattr, celery_app.conf, 'task_always_eager', always_eager)
+
+    def add_image(self, **fields):
+        return PrescriptionImage.objects.create(
+            prescription=self.prescription,
+            original_image=jpeg_upload(prescription_photo()),
+            **fields
+        )
+
+    def test_images_fan_out_and_merge(self):
+        images = [self.add_image(), self.add_image()]
+        process = mock.patch.object(
+            PrescriptionImagePipeline, 'process', autospec=True, side_effect=PrescriptionImagePipeline.process
+        )
+
+        with process as pipeline_process:
+            process_prescription_images(self.prescription.id)
+
+        processed = sorted(call.args[1].id for call in pipeline_process.call_args_list)
+        self.assertEqual(processed, [image.id for image in images])
+        self.prescription.refresh_from_db()
+        self.assertEqual(self.prescription.processing_status, 'completed')
+        self.assertTrue(self.prescription.is_processed)
+        self.assertEqual(self.prescription.medicines.count(), 1)
+
+    def test_completed_images_are_skipped_unless_forced(self):
+        self.add_image(processing_status='completed', extracted_text=PRESCRIPTION_TEXT)
+
+        process_prescription_images(self.prescription.id)
+        self.tesseract.assert_not_called()
+
+        process_prescription_images(self.prescription.id, force=True)
+        self.tesseract.assert_called()
+
+    def test_partial_failure_keeps_the_prescription(self):
+        self.add_image(processing_status='completed', extracted_text=PRESCRIPTION_TEXT)
+        self.add_image(processing_status='failed', processing_error='OCR failed')
+
+        finalize_prescription([], self.prescription.id)
+
+        self.prescription.refresh_from_db()
+        self.assertEqual(self.prescription.processing_status, 'completed')
+        self.assertEqual(self.prescription.medicines.count(), 1)
+
+    def test_prescription_fails_when_every_image_fails(self):
+        self.add_image(processing_status='failed', processing_error='OCR failed')
+        self.add_image(processing_status='failed', processing_error='OCR failed')
+
+        finalize_prescription([], self.prescription.id)
+
+        self.prescription.refresh_from_db()
+        self.assertEqual(self.prescription.processing_status, 'failed')
+        self.assertFalse(self.prescription.is_processed)
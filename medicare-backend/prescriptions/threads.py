@@ -0,0 +1,80 @@
+"""
+Per-process thread budget for the native libraries behind OCR.
+
+torch (via EasyOCR), OpenMP/BLAS, OpenCV and Tesseract each size their
+thread pools to the whole machine. With several worker processes per node
+that oversubscribes the cores, so every process gets a share of the cores
+and each library is capped to it.
+"""
+import logging
+import os
+import sys
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Read by OpenMP/BLAS when they load, and by every Tesseract subprocess
+THREAD_ENV_VARS = ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'OMP_THREAD_LIMIT')
+# Carries the budget from the Celery main process to its forked children
+BUDGET_ENV_VAR = 'OCR_THREAD_BUDGET'
+
+
+def available_cores():
+    """Cores this process may run on, respecting cpusets and container limits"""
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        # Not Linux
+        return list(range(os.cpu_count() or 1))
+
+
+def compute_thread_budget(processes):
+    """Threads each of `processes` worker processes on this node should use"""
+    if settings.OCR_THREADS_PER_PROCESS:
+        return settings.OCR_THREADS_PER_PROCESS
+    return max(1, len(available_cores()) // max(1, processes))
+
+
+def thread_budget():
+    """Budget applied to this process (or inherited from its parent), or None"""
+    value = os.environ.get(BUDGET_ENV_VAR)
+    return int(value) if value else None
+
+
+def apply_thread_budget(threads, slot=None):
+    """
+    Cap the OCR libraries in this process to `threads` threads.
+
+    Environment variables only reach libraries loaded afterwards and
+    subprocesses, so this should run before the engines are imported;
+    OpenCV and an already loaded torch are capped directly. With
+    OCR_PIN_CORES, `slot` (the worker's pool index) pins the process to its
+    own run of cores.
+    """
+    for name in THREAD_ENV_VARS:
+        os.environ[name] = str(threads)
+    os.environ[BUDGET_ENV_VAR] = str(threads)
+
+    try:
+        import cv2
+        cv2.setNumThreads(threads)
+    except ImportError:
+        pass
+
+    # Importing torch just to cap it would cost every process its load time
+    torch = sys.modules.get('torch')
+    if torch is not None:
+        torch.set_num_threads(threads)
+
+    pinned = None
+    if settings.OCR_PIN_CORES and slot is not None and hasattr(os, 'sched_setaffinity'):
+        cores = available_cores()
+        start = slot * threads
+        pinned = [cores[(start + offset) % len(cores)] for offset in range(min(threads, len(cores)))]
+        os.sched_setaffinity(0, pinned)
+
+    logger.info(
+        f"OCR thread budget for pid {os.getpid()}: {threads} threads"
+        f"{f', pinned to cores {pinned}' if pinned else ''}"
+    )
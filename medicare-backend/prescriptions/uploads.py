@@ -0,0 +1,87 @@
+"""
+Bounded-memory handling of prescription uploads.
+
+Django keeps uploads under FILE_UPLOAD_MAX_MEMORY_SIZE in memory and only
+checks sizes once the whole request has been read. Prescription endpoints
+stream every file to a temporary file instead, hashing it on the way and
+cutting the upload off as soon as a size limit is passed, so a request
+holds about one chunk in memory however many files it carries.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.files.uploadhandler import StopUpload, TemporaryFileUploadHandler
+
+
+def _megabytes(size):
+    return size // (1024 * 1024)
+
+
+class PrescriptionUploadHandler(TemporaryFileUploadHandler):
+    """
+    Streams each file to disk with its SHA-256 computed on the fly
+    (available as `content_hash` on the uploaded file). Enforces
+    PRESCRIPTION_MAX_FILE_BYTES per file and PRESCRIPTION_MAX_UPLOAD_BYTES
+    across the request; the reason for stopping is left on the request as
+    `upload_error`.
+    """
+    chunk_size = 64 * 1024
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        self.request_length = content_length
+        self.received = 0
+
+    def new_file(self, *args, **kwargs):
+        # Form fields are capped by DATA_UPLOAD_MAX_MEMORY_SIZE, so anything beyond both limits is files
+        fields_limit = settings.DATA_UPLOAD_MAX_MEMORY_SIZE
+        if fields_limit is not None and self.request_length > settings.PRESCRIPTION_MAX_UPLOAD_BYTES + fields_limit:
+            self._stop(self._upload_too_large())
+
+        super().new_file(*args, **kwargs)
+        self.digest = hashlib.sha256()
+        self.file_bytes = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.file_bytes += len(raw_data)
+        self.received += len(raw_data)
+
+        if self.file_bytes > settings.PRESCRIPTION_MAX_FILE_BYTES:
+            self._stop(
+                f"Image {self.file_name} is too large. "
+                f"Maximum size is {_megabytes(settings.PRESCRIPTION_MAX_FILE_BYTES)}MB."
+            )
+        if self.received > settings.PRESCRIPTION_MAX_UPLOAD_BYTES:
+            self._stop(self._upload_too_large())
+
+        self.digest.update(raw_data)
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        uploaded_file = super().file_complete(file_size)
+        uploaded_file.content_hash = self.digest.hexdigest()
+        return uploaded_file
+
+    def _upload_too_large(self):
+        return f"Upload is too large. Maximum total size is {_megabytes(settings.PRESCRIPTION_MAX_UPLOAD_BYTES)}MB."
+
+    def _stop(self, message):
+        """Abandon the upload without reading the rest of the body"""
+        self.request.upload_error = message
+        self.upload_interrupted()
+        raise StopUpload(connection_reset=True)
+
+
+class StreamingUploadMixin:
+    """Parses multipart bodies with PrescriptionUploadHandler. Must come before the view class."""
+
+    def initialize_request(self, request, *args, **kwargs):
+        # Handlers have to be in place before anything reads request.POST
+        request.upload_handlers = [PrescriptionUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
+
+
+def get_upload_error(request):
+    """Why PrescriptionUploadHandler cut the request's upload off, or None"""
+    # Reading the data runs the handlers
+    request.data
+    return getattr(request, 'upload_error', None)
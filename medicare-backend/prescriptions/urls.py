@@ -2,13 +2,15 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
     PrescriptionViewSet, MedicineViewSet, PrescriptionImageViewSet,
-    PrescriptionUploadView, UserAnalyticsView
+    PrescriptionUploadView, UserAnalyticsView, OCREngineStatsView, UploadSessionViewSet
 )
 
 router = DefaultRouter()
 router.register(r'prescriptions', PrescriptionViewSet, basename='prescription')
 router.register(r'medicines', MedicineViewSet, basename='medicine')
 router.register(r'images', PrescriptionImageViewSet, basename='prescription-image')
+# Resumable chunked uploads
+router.register(r'uploads', UploadSessionViewSet, basename='upload-session')
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -19,6 +21,9 @@ urlpatterns = [
     # Analytics endpoint
     path('analytics/', UserAnalyticsView.as_view(), name='user-analytics'),
     
+    # OCR engine diagnostics (admin only)
+    path('ocr/engines/', OCREngineStatsView.as_view(), name='ocr-engine-stats'),
+    
     # Additional endpoints
     path('prescriptions/<int:pk>/reprocess/', 
          PrescriptionViewSet.as_view({'post': 'reprocess'}), 
@@ -1,41 +1,66 @@
-from PIL import Image, ImageEnhance, ImageFilter
+from PIL import Image
 import io
 import os
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from django.conf import settings
 from django.core.files.base import ContentFile
 import logging
 
+from .engines import (
+    engine_backlog, expected_engine_latency, get_easyocr_batcher, get_easyocr_reader,
+    get_tile_pool, get_tile_threads, record_engine_latency, record_roi, submit_engine
+)
+from .imaging import DecodedImage, decode_preview
+from .ocr_service import OCRServiceError, recognize_remote
+
 logger = logging.getLogger(__name__)
 
 
 class ImageProcessor:
     """Handles image compression, enhancement, and OCR processing"""
     
+    # Configure tesseract for medical text
+    TESSERACT_CONFIG = r'--oem 3 --psm 6 -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz.,()/-: '
+    
+    # Orientation and script detection only
+    OSD_CONFIG = r'--psm 0 -c min_characters_to_try=5'
+    
+    # PIL's ImageFilter.SMOOTH kernel, used as the blur reference for sharpening
+    _SMOOTH_KERNEL = [[1 / 13, 1 / 13, 1 / 13], [1 / 13, 5 / 13, 1 / 13], [1 / 13, 1 / 13, 1 / 13]]
+    
+    # File extension for each format compressed images can be written in
+    COMPRESSION_EXTENSIONS = {'JPEG': 'jpg', 'WEBP': 'webp'}
+    BILEVEL_EXTENSIONS = {'PNG': 'png', 'TIFF': 'tif'}
+    
     def __init__(self):
-        self.easyocr_reader = None
         # Configure tesseract path if needed
         # pytesseract.pytesseract.tesseract_cmd = r'/usr/bin/tesseract'
+        pass
+    
+    def _get_easyocr_reader(self, languages=None):
+        """Shared EasyOCR reader for the languages (default OCR_LANGUAGES), loaded once per process"""
+        return get_easyocr_reader(languages)
     
-    def _get_easyocr_reader(self):
-        """Lazy load EasyOCR reader"""
-        if self.easyocr_reader is None:
-            import easyocr
-            self.easyocr_reader = easyocr.Reader(['en'])
-        return self.easyocr_reader
+    def decode(self, image):
+        """Decode an uploaded file once; already decoded images pass through"""
+        if isinstance(image, DecodedImage):
+            return image
+        return DecodedImage.from_file(image)
     
-    def compress_image(self, image_file, quality=85, max_width=1200):
+    def compress_image(self, image, quality=None, max_width=None):
         """
-        Compress image while maintaining readability for OCR
+        Compress image while maintaining readability for OCR.
+        Each format in COMPRESSION_FORMATS gets the lowest quality that keeps
+        COMPRESSION_MIN_PSNR, lowered further when that still misses
+        COMPRESSION_TARGET_BYTES; the smallest encoding wins. A fixed quality
+        skips the search. The returned file is named with the format's extension.
         """
         try:
-            # Open image
-            img = Image.open(image_file)
+            import numpy as np
             
-            # Convert to RGB if necessary
-            if img.mode in ('RGBA', 'LA', 'P'):
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-                img = background
+            img = self.decode(image).to_pil()
+            max_width = max_width or settings.COMPRESSION_MAX_WIDTH
             
             # Resize if too large
             if img.width > max_width:
@@ -43,143 +68,972 @@ class ImageProcessor:
                 new_height = int(img.height * ratio)
                 img = img.resize((max_width, new_height), Image.Resampling.LANCZOS)
             
-            # Save compressed image
-            output = io.BytesIO()
-            img.save(output, format='JPEG', quality=quality, optimize=True)
-            output.seek(0)
+            # Fidelity is judged on luminance, which is what carries the text
+            reference = np.asarray(img.convert('L'), dtype=np.float32)
             
-            return ContentFile(output.read())
+            best_format, best_data = None, None
+            for image_format in settings.COMPRESSION_FORMATS:
+                data = self._search_quality(img, reference, image_format, quality)
+                if best_data is None or len(data) < len(best_data):
+                    best_format, best_data = image_format, data
+            
+            extension = self.COMPRESSION_EXTENSIONS[best_format]
+            return ContentFile(best_data, name=f"compressed.{extension}")
             
         except Exception as e:
             logger.error(f"Error compressing image: {str(e)}")
             return None
     
-    def enhance_image_for_ocr(self, image_file):
+    def _search_quality(self, img, reference, image_format, quality=None):
+        """
+        Encoded bytes at the quality the budget and PSNR floor call for,
+        binary-searched over COMPRESSION_QUALITY_STEPS.
+        """
+        if quality:
+            return self._encode(img, image_format, quality)
+        
+        steps = settings.COMPRESSION_QUALITY_STEPS
+        encoded = {}
+        
+        def encode(index):
+            if index not in encoded:
+                encoded[index] = self._encode(img, image_format, steps[index])
+            return encoded[index]
+        
+        # Lowest quality that keeps the floor; PSNR rises with quality
+        low, high = 0, len(steps) - 1
+        while low < high:
+            middle = (low + high) // 2
+            if self._psnr(reference, encode(middle)) >= settings.COMPRESSION_MIN_PSNR:
+                high = middle
+            else:
+                low = middle + 1
+        chosen = low
+        
+        # Still over budget: give up fidelity, down to the lowest step
+        if len(encode(chosen)) > settings.COMPRESSION_TARGET_BYTES:
+            low, high = 0, chosen
+            while low < high:
+                middle = (low + high + 1) // 2
+                if len(encode(middle)) <= settings.COMPRESSION_TARGET_BYTES:
+                    low = middle
+                else:
+                    high = middle - 1
+            chosen = low
+        
+        return encode(chosen)
+    
+    def _encode(self, img, image_format, quality):
+        output = io.BytesIO()
+        if image_format == 'WEBP':
+            img.save(output, format='WEBP', quality=quality, method=4)
+        else:
+            img.save(output, format='JPEG', quality=quality, optimize=True)
+        return output.getvalue()
+    
+    def _psnr(self, reference, data):
+        """Peak signal-to-noise ratio (dB) of encoded bytes against the luminance reference"""
+        import numpy as np
+        
+        with Image.open(io.BytesIO(data)) as decoded:
+            pixels = np.asarray(decoded.convert('L'), dtype=np.float32)
+        mse = float(np.mean((reference - pixels) ** 2))
+        if mse == 0:
+            return float('inf')
+        return 10 * np.log10(255.0 ** 2 / mse)
+    
+    def enhance_image_for_ocr(self, image):
         """
         Enhance image for better OCR results
         """
         try:
-            import cv2
-            import numpy as np
-            
-            # Open image
-            img = Image.open(image_file)
-            
-            # Convert to grayscale
-            if img.mode != 'L':
-                img = img.convert('L')
-            
-            # Enhance contrast
-            enhancer = ImageEnhance.Contrast(img)
-            img = enhancer.enhance(1.5)
+            return self.encode_bilevel(self.enhance_array(image))
             
-            # Enhance sharpness
-            enhancer = ImageEnhance.Sharpness(img)
-            img = enhancer.enhance(1.2)
-            
-            # Apply slight blur to reduce noise
-            img = img.filter(ImageFilter.MedianFilter(size=3))
-            
-            # Convert to OpenCV format for advanced processing
-            cv_img = cv2.cvtColor(np.array(img), cv2.COLOR_GRAY2BGR)
+        except Exception as e:
+            logger.error(f"Error enhancing image: {str(e)}")
+            return None
+    
+    def encode_bilevel(self, gray, threshold=128):
+        """
+        Lossless 1-bit file (PROCESSED_IMAGE_FORMAT) for a black and white
+        grayscale buffer, named with the format's extension. Pixels below
+        the threshold are black.
+        """
+        import numpy as np
+        
+        bilevel = Image.fromarray(np.where(gray >= threshold, 255, 0).astype(np.uint8)).convert('1', dither=Image.Dither.NONE)
+        image_format = settings.PROCESSED_IMAGE_FORMAT
+        
+        output = io.BytesIO()
+        if image_format == 'TIFF':
+            bilevel.save(output, format='TIFF', compression='group4')
+        else:
+            bilevel.save(output, format='PNG', optimize=True)
+        
+        return ContentFile(output.getvalue(), name=f"processed.{self.BILEVEL_EXTENSIONS[image_format]}")
+    
+    def enhance_array(self, image, deskew=None):
+        """
+        Binarized grayscale buffer for OCR. Computed once per decoded image
+        and shared by the stored processed image and the 'processed' OCR source.
+        
+        Runs entirely in OpenCV on the shared grayscale buffer: deskew,
+        contrast stretch, sharpen, median denoise and adaptive threshold.
+        Images above OCR_ENHANCE_TILE_PIXELS are processed in horizontal
+        bands so the temporaries stay bounded.
+        """
+        decoded = self.decode(image)
+        if 'processed' in decoded.derived:
+            return decoded.derived['processed']
+        
+        import numpy as np
+        
+        gray, _ = self.deskewed(decoded, deskew)
+        
+        # Contrast pivots on the global mean, so compute it once for all bands
+        mean = int(gray.mean() + 0.5)
+        
+        if gray.size <= settings.OCR_ENHANCE_TILE_PIXELS:
+            thresh = self._enhance_block(gray, mean)
+        else:
+            thresh = np.empty_like(gray)
+            band = settings.OCR_ENHANCE_TILE_ROWS
+            # Enough overlap to cover the sharpen, median and threshold neighbourhoods
+            margin = 8
+            for top in range(0, gray.shape[0], band):
+                bottom = min(top + band, gray.shape[0])
+                start = max(0, top - margin)
+                end = min(gray.shape[0], bottom + margin)
+                block = self._enhance_block(gray[start:end], mean)
+                thresh[top:bottom] = block[top - start:top - start + (bottom - top)]
+        
+        decoded.derived['processed'] = thresh
+        return thresh
+    
+    def deskewed(self, image, deskew=None):
+        """
+        (grayscale buffer, angle) with a small skew straightened, computed
+        once per decoded image and shared by the working and processed
+        images. angle is the rotation applied, 0 when none was needed.
+        """
+        decoded = self.decode(image)
+        if 'deskewed' in decoded.derived:
+            return decoded.derived['deskewed']
+        
+        gray, angle = decoded.gray, 0.0
+        if settings.OCR_DESKEW if deskew is None else deskew:
+            estimated = self.estimate_skew(gray)
+            if abs(estimated) >= 0.25:
+                gray, angle = self._rotate(gray, estimated), estimated
+        
+        decoded.derived['deskewed'] = (gray, angle)
+        return gray, angle
+    
+    def _enhance_block(self, gray, mean):
+        """Contrast, sharpen, denoise and threshold one block of a grayscale image"""
+        import cv2
+        import numpy as np
+        
+        # Contrast x1.5 around the mean (what ImageEnhance.Contrast does), saturating to uint8
+        img = cv2.addWeighted(gray, 1.5, gray, 0.0, -0.5 * mean)
+        
+        # Sharpness x1.2: push away from PIL's SMOOTH-filtered copy
+        smooth = cv2.filter2D(img, -1, np.array(self._SMOOTH_KERNEL, dtype=np.float32))
+        img = cv2.addWeighted(img, 1.2, smooth, -0.2, 0.0)
+        
+        # Slight median blur to reduce noise
+        img = cv2.medianBlur(img, 3)
+        
+        return cv2.adaptiveThreshold(
+            img, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2
+        )
+    
+    def estimate_skew(self, gray, max_angle=5.0, step=0.25):
+        """
+        Small-angle skew in degrees from a projection-profile search on a
+        thumbnail: text lines give the sharpest row profile when level
+        """
+        import cv2
+        import numpy as np
+        
+        scale = min(1.0, 600 / max(gray.shape))
+        small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        _, binary = cv2.threshold(small, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+        
+        height, width = binary.shape
+        center = (width / 2, height / 2)
+        best_angle, best_score = 0.0, -1.0
+        
+        for angle in np.arange(-max_angle, max_angle + step / 2, step):
+            matrix = cv2.getRotationMatrix2D(center, float(angle), 1.0)
+            rotated = cv2.warpAffine(binary, matrix, (width, height), flags=cv2.INTER_NEAREST)
+            score = float(np.var(rotated.sum(axis=1, dtype=np.float64)))
+            if score > best_score:
+                best_angle, best_score = float(angle), score
+        
+        return best_angle
+    
+    def _rotate(self, gray, angle):
+        """Rotate about the centre, filling exposed corners with white"""
+        import cv2
+        
+        height, width = gray.shape
+        matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+        return cv2.warpAffine(
+            gray, matrix, (width, height),
+            flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT, borderValue=255
+        )
+    
+    def detect_orientation(self, image):
+        """
+        Run Tesseract's orientation and script detection on a thumbnail.
+        Returns {'rotate', 'script', 'confidence'}, where rotate is the
+        clockwise turn in degrees that makes the text upright. rotate is 0
+        when detection fails or isn't confident.
+        """
+        import cv2
+        
+        started = time.perf_counter()
+        gray = self.decode(image).gray
+        
+        thumb_scale = min(1.0, settings.OCR_ORIENTATION_MAX_DIMENSION / max(gray.shape))
+        if thumb_scale < 1.0:
+            gray = cv2.resize(gray, None, fx=thumb_scale, fy=thumb_scale, interpolation=cv2.INTER_AREA)
+        
+        try:
+            import pytesseract
             
-            # Apply adaptive thresholding
-            gray = cv2.cvtColor(cv_img, cv2.COLOR_BGR2GRAY)
-            thresh = cv2.adaptiveThreshold(
-                gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2
+            osd = pytesseract.image_to_osd(
+                gray, config=self.OSD_CONFIG, output_type=pytesseract.Output.DICT
             )
-            
-            # Convert back to PIL
-            enhanced_img = Image.fromarray(thresh)
-            
-            # Save enhanced image
-            output = io.BytesIO()
-            enhanced_img.save(output, format='JPEG', quality=95)
-            output.seek(0)
-            
-            return ContentFile(output.read())
-            
         except Exception as e:
-            logger.error(f"Error enhancing image: {str(e)}")
+            # Too little text for OSD is common on sparse prescriptions
+            logger.warning(f"Orientation detection failed: {str(e)}")
+            return {'rotate': 0, 'script': None, 'confidence': 0.0}
+        
+        confidence = float(osd.get('orientation_conf', 0.0))
+        rotate = int(osd.get('rotate', 0)) % 360
+        if confidence < settings.OCR_ORIENTATION_MIN_CONFIDENCE:
+            rotate = 0
+        
+        logger.info(
+            f"Orientation: rotate {rotate} (confidence {confidence:.1f}, script {osd.get('script')}) "
+            f"in {(time.perf_counter() - started) * 1000:.0f}ms"
+        )
+        return {'rotate': rotate, 'script': osd.get('script'), 'confidence': confidence}
+    
+    def estimate_text_height(self, gray):
+        """
+        Median height in pixels of character-sized blobs, or None when the
+        image doesn't contain enough of them to tell
+        """
+        import cv2
+        import numpy as np
+        
+        # Probe a bounded-size copy; heights are scaled back afterwards
+        probe_scale = min(1.0, 1600 / max(gray.shape))
+        if probe_scale < 1.0:
+            gray = cv2.resize(gray, None, fx=probe_scale, fy=probe_scale, interpolation=cv2.INTER_AREA)
+        
+        binary = cv2.adaptiveThreshold(
+            gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 15, 10
+        )
+        _, _, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+        heights = stats[1:, cv2.CC_STAT_HEIGHT]
+        widths = stats[1:, cv2.CC_STAT_WIDTH]
+        
+        # Drop specks, table rules and borders
+        is_character = (
+            (heights >= 4) & (heights <= gray.shape[0] * 0.1) &
+            (widths <= heights * 4)
+        )
+        if np.count_nonzero(is_character) < 20:
             return None
+        
+        return float(np.median(heights[is_character])) / probe_scale
+    
+    def working_image(self, image):
+        """
+        Resolution-normalized grayscale copy for OCR: text is scaled towards
+        OCR_TARGET_TEXT_HEIGHT pixels. Without tiling the long side is capped
+        at OCR_WORKING_MAX_DIMENSION, so a 12 MP phone photo isn't recognized
+        at full size in one piece; with tiling the looser
+        OCR_TILED_WORKING_MAX_DIMENSION applies and large images are
+        recognized in bands. Small skews are straightened first.
+        """
+        decoded = self.decode(image)
+        if 'working' in decoded.derived:
+            return decoded.derived['working']
+        
+        import cv2
+        
+        gray, angle = self.deskewed(decoded)
+        long_side = max(gray.shape)
+        
+        text_height = self.estimate_text_height(gray)
+        scale = settings.OCR_TARGET_TEXT_HEIGHT / text_height if text_height else 1.0
+        max_dimension = (
+            settings.OCR_TILED_WORKING_MAX_DIMENSION if settings.OCR_TILE_MIN_PIXELS
+            else settings.OCR_WORKING_MAX_DIMENSION
+        )
+        scale = max(0.25, min(scale, 2.0, max_dimension / long_side))
+        
+        if abs(scale - 1.0) < 0.05:
+            working = DecodedImage(gray, format=decoded.format, skew=angle)
+        else:
+            interpolation = cv2.INTER_AREA if scale < 1.0 else cv2.INTER_CUBIC
+            resized = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=interpolation)
+            working = DecodedImage(resized, format=decoded.format, scale=scale, skew=angle)
+        
+        decoded.derived['working'] = working
+        return working
+    
+    def ocr_source(self, image, source):
+        """
+        Image an engine should read: 'original' pixels, the normalized
+        'working' image or the binarized 'processed' image
+        """
+        decoded = self.decode(image)
+        if source == 'working':
+            return self.working_image(decoded)
+        if source == 'processed':
+            processed = self.enhance_array(decoded)
+            return DecodedImage(processed, format=decoded.format, skew=self.deskewed(decoded)[1])
+        return decoded
+    
+    def detect_text_regions(self, image):
+        """
+        Horizontal bands (x, y, w, h) holding text, found by morphology on a
+        downscaled binary copy. Blobs sharing rows are merged into one band so
+        lines keep their left-to-right layout. Returns None when the bands
+        cover too much of the image for cropping to pay off.
+        """
+        decoded = self.decode(image)
+        if 'regions' in decoded.derived:
+            return decoded.derived['regions']
+        
+        import cv2
+        
+        gray = decoded.gray
+        probe_scale = min(1.0, 1000 / max(gray.shape))
+        if probe_scale < 1.0:
+            gray = cv2.resize(gray, None, fx=probe_scale, fy=probe_scale, interpolation=cv2.INTER_AREA)
+        
+        binary = cv2.adaptiveThreshold(
+            gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 15, 10
+        )
+        # Smear characters into words and words into lines, without bridging lines
+        blobs = cv2.dilate(binary, cv2.getStructuringElement(cv2.MORPH_RECT, (15, 3)))
+        _, _, stats, _ = cv2.connectedComponentsWithStats(blobs, connectivity=8)
+        
+        # Drop specks and take the blobs back to full resolution
+        boxes = [
+            (x / probe_scale, y / probe_scale, w / probe_scale, h / probe_scale)
+            for x, y, w, h, _ in stats[1:].tolist() if w >= 6 and h >= 6
+        ]
+        regions = self.text_bands(decoded, boxes)
+        
+        decoded.derived['regions'] = regions
+        return regions
     
-    def extract_text_tesseract(self, image_file):
+    def text_bands(self, image, boxes, margin=8):
+        """
+        Merge text boxes (x, y, w, h) whose rows overlap into horizontal bands
+        of the image, with a margin so glyph edges aren't clipped. Returns None
+        when there are no boxes or the bands cover too much of the image for
+        cropping to pay off.
+        """
+        import numpy as np
+        
+        bands = []
+        for x, y, w, h in sorted(boxes, key=lambda box: box[1]):
+            if bands and y <= bands[-1][3]:
+                left, top, right, bottom = bands[-1]
+                bands[-1] = [min(left, x), top, max(right, x + w), max(bottom, y + h)]
+            else:
+                bands.append([x, y, x + w, y + h])
+        if not bands:
+            return None
+        
+        decoded = self.decode(image)
+        height, width = decoded.pixels.shape[:2]
+        regions = []
+        for left, top, right, bottom in bands:
+            left = max(int(left) - margin, 0)
+            top = max(int(top) - margin, 0)
+            right = min(int(np.ceil(right)) + margin, width)
+            bottom = min(int(np.ceil(bottom)) + margin, height)
+            regions.append((left, top, right - left, bottom - top))
+        
+        covered = sum(w * h for _, _, w, h in regions)
+        if covered > settings.OCR_ROI_MAX_COVERAGE * width * height:
+            return None
+        return regions
+    
+    def crop_text_regions(self, image, regions, gap=16):
+        """
+        Stack region crops top to bottom on a white canvas with a gap-wide
+        border, keeping their horizontal positions. Returns the stacked image,
+        the source x of the stack's left edge and, per region, its
+        (stack_top, top, height) for mapping boxes back.
+        """
+        import numpy as np
+        
+        decoded = self.decode(image)
+        left = min(x for x, _, _, _ in regions) - gap
+        right = max(x + w for x, _, w, _ in regions) + gap
+        height = sum(h for _, _, _, h in regions) + gap * (len(regions) + 1)
+        
+        stack = np.full((height, right - left) + decoded.pixels.shape[2:], 255, dtype=np.uint8)
+        placements = []
+        stack_top = gap
+        for x, y, w, h in regions:
+            stack[stack_top:stack_top + h, x - left:x - left + w] = decoded.pixels[y:y + h, x:x + w]
+            placements.append((stack_top, y, h))
+            stack_top += h + gap
+        
+        return DecodedImage(stack, format=decoded.format), left, placements
+    
+    def _extract_tesseract_regions(self, source, timeout=0):
+        """
+        Run Tesseract on the stacked text regions of the source, mapping word
+        boxes back to source pixels. Falls back to the full frame when no
+        useful regions are found.
+        """
+        started = time.perf_counter()
+        regions = self.detect_text_regions(source)
+        detect_seconds = time.perf_counter() - started
+        if not regions:
+            record_roi(0.0, detect_seconds)
+            return dict(self._recognize('tesseract', source, timeout=timeout), roi_reduction=0.0)
+        
+        stack, left, placements = self.crop_text_regions(source, regions)
+        result = self._recognize('tesseract', stack, timeout=timeout)
+        
+        for word in result['words']:
+            center = word['top'] + word['height'] / 2
+            for stack_top, top, height in reversed(placements):
+                if center >= stack_top:
+                    word['top'] += top - stack_top
+                    break
+            word['left'] += left
+        
+        # Share of the source's pixels Tesseract didn't have to read
+        reduction = 1 - (stack.width * stack.height) / (source.width * source.height)
+        record_roi(reduction, detect_seconds)
+        logger.info(
+            f"Text regions: {len(regions)} bands, {reduction:.0%} fewer pixels, "
+            f"detection {detect_seconds * 1000:.0f}ms"
+        )
+        result['roi_reduction'] = reduction
+        return result
+    
+    def detect_easyocr_text(self, image, languages=None):
+        """
+        Run EasyOCR's text detector on the image ahead of recognition. The
+        detection is kept on the image so EasyOCR recognizes its boxes without
+        detecting again. Returns the boxes (x, y, w, h), or None when EasyOCR
+        doesn't run unbatched in this process or the image will be tiled.
+        """
+        if settings.OCR_SERVICE_URL or settings.OCR_EASYOCR_BATCHING or self._needs_tiling(image):
+            return None
+        
+        decoded = self.decode(image)
+        try:
+            horizontal, free = self._get_easyocr_reader(languages).detect(decoded.pixels)
+        except Exception as e:
+            logger.warning(f"EasyOCR text detection failed: {str(e)}")
+            return None
+        
+        # One image in, so one list of each kind out
+        detection = (horizontal[0], free[0])
+        decoded.derived['easyocr_detection'] = detection
+        boxes = [(x_min, y_min, x_max - x_min, y_max - y_min) for x_min, x_max, y_min, y_max in detection[0]]
+        for polygon in detection[1]:
+            xs = [point[0] for point in polygon]
+            ys = [point[1] for point in polygon]
+            boxes.append((min(xs), min(ys), max(xs) - min(xs), max(ys) - min(ys)))
+        return boxes
+    
+    def _share_easyocr_regions(self, easyocr_source, tesseract_source, languages=None):
+        """
+        Seed Tesseract's text regions from EasyOCR's detector so the
+        concurrent path finds the text once. Sources deskewed by different
+        angles don't share coordinates; Tesseract then finds its own.
+        """
+        if easyocr_source.skew != tesseract_source.skew:
+            return
+        boxes = self.detect_easyocr_text(easyocr_source, languages)
+        if boxes is None:
+            return
+        
+        factor = tesseract_source.scale / easyocr_source.scale
+        tesseract_source.derived['regions'] = self.text_bands(
+            tesseract_source, [(x * factor, y * factor, w * factor, h * factor) for x, y, w, h in boxes]
+        )
+    
+    def _recognize(self, engine, image, timeout=0, languages=None):
+        """
+        Run one engine on an image, tiling it across cores when it is very large
+        """
+        if self._needs_tiling(image):
+            return self._extract_tiled(engine, image, timeout=timeout, languages=languages)
+        if engine == 'tesseract':
+            return self.extract_tesseract_data(image, timeout=timeout)
+        return self.extract_easyocr_data(image, languages=languages)
+    
+    def _needs_tiling(self, image):
+        """Whether the image is large enough to recognize in tiles"""
+        return bool(settings.OCR_TILE_MIN_PIXELS) and image.width * image.height >= settings.OCR_TILE_MIN_PIXELS
+    
+    def _extract_tiled(self, engine, image, timeout=0, languages=None):
+        """
+        Recognize an image as overlapping full-width bands in parallel:
+        Tesseract bands in the tile pool, EasyOCR bands in threads sharing
+        the loaded reader. The overlap is taller than a text line, so every
+        line is whole in some band; each band keeps only the words whose
+        center falls in its own share of the overlap, so seam words appear
+        once and in order.
+        """
+        import numpy as np
+        
+        started = time.perf_counter()
+        tile_height = settings.OCR_TILE_HEIGHT
+        overlap = settings.OCR_TILE_OVERLAP
+        tops = list(range(0, max(image.height - overlap, 1), tile_height - overlap))
+        
+        pool = get_tile_pool() if engine == 'tesseract' else get_tile_threads()
+        futures = [
+            pool.submit(
+                recognize_tile, engine,
+                np.ascontiguousarray(image.pixels[top:top + tile_height]), timeout, languages
+            )
+            for top in tops
+        ]
+        
+        words = []
+        degraded = False
+        for index, (top, future) in enumerate(zip(tops, futures)):
+            own_top = top + overlap / 2 if index > 0 else 0
+            own_bottom = top + tile_height - overlap / 2 if index < len(tops) - 1 else image.height
+            tile_result = future.result()
+            degraded = degraded or tile_result.get('degraded', False)
+            for word in tile_result['words']:
+                word['top'] += top
+                if not own_top <= word['top'] + word['height'] / 2 < own_bottom:
+                    continue
+                if 'block' in word:
+                    # Tesseract numbers blocks per band; keep them distinct across bands
+                    word['block'] += index * 1000
+                words.append(word)
+        
+        if engine == 'tesseract':
+            text = self._words_to_text(words)
+            confidences = [word['confidence'] for word in words if word['confidence'] > 0]
+        else:
+            text = ' '.join(word['text'] for word in words)
+            confidences = [word['confidence'] for word in words]
+        
+        logger.info(
+            f"Tiled {engine} OCR: {len(tops)} bands of {image.width}x{tile_height}, "
+            f"{len(words)} words in {time.perf_counter() - started:.2f}s"
+        )
+        return {
+            'text': text,
+            'confidence': sum(confidences) / len(confidences) if confidences else 0,
+            'words': words,
+            'degraded': degraded,
+        }
+    
+    def assess_quality(self, image_file):
+        """
+        Quick readability check on a downscaled preview, run before any OCR.
+        Returns a list of problems, each telling the user how to retake the
+        photo; an empty list means the image is worth processing.
+        """
+        import cv2
+        import numpy as np
+        
+        started = time.perf_counter()
+        gray, (width, height) = decode_preview(image_file)
+        preview_scale = gray.shape[1] / width
+        problems = []
+        
+        if min(width, height) < settings.OCR_QUALITY_MIN_SIDE:
+            problems.append(
+                f"is too small ({width}x{height} pixels); upload a photo at least "
+                f"{settings.OCR_QUALITY_MIN_SIDE} pixels on each side"
+            )
+        
+        # Ink (darkest 0.1%) against paper (median); faint ink means a washed-out photo
+        ink, paper = np.percentile(gray, (0.1, 50))
+        if gray.mean() < settings.OCR_QUALITY_MIN_BRIGHTNESS:
+            problems.append("is too dark; retake it in better light")
+        elif paper - ink < settings.OCR_QUALITY_MIN_CONTRAST:
+            problems.append("has almost no contrast; make sure the prescription fills the frame and isn't washed out")
+        
+        sharpness = cv2.Laplacian(gray, cv2.CV_64F).var()
+        if sharpness < settings.OCR_QUALITY_MIN_SHARPNESS:
+            problems.append("is too blurry; hold the camera steady and let it focus")
+        
+        # Text height is measured on the preview; scale it back to original pixels
+        text_height = self.estimate_text_height(gray)
+        if text_height is not None and text_height / preview_scale < settings.OCR_QUALITY_MIN_TEXT_HEIGHT:
+            problems.append("has text too small to read; take the photo closer to the prescription")
+        
+        logger.debug(
+            f"Quality check for {getattr(image_file, 'name', 'image')}: sharpness {sharpness:.1f}, "
+            f"{len(problems)} problems in {(time.perf_counter() - started) * 1000:.1f}ms"
+        )
+        return problems
+    
+    def extract_text_tesseract(self, image):
         """
         Extract text using Tesseract OCR
         """
+        result = self.extract_tesseract_data(image)
+        return result['text'], result['confidence']
+    
+    def extract_tesseract_data(self, image, timeout=0):
+        """
+        Run Tesseract once and rebuild the text, average confidence and
+        word boxes from its TSV output. A non-zero timeout (seconds) kills
+        the Tesseract process when it runs over.
+        """
         try:
             import pytesseract
             
-            img = Image.open(image_file)
+            img = self.decode(image).pixels
             
-            # Configure tesseract for medical text
-            custom_config = r'--oem 3 --psm 6 -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz.,()/-: '
+            # A single image_to_data pass gives both the words and their confidences
+            data = pytesseract.image_to_data(
+                img, config=self.TESSERACT_CONFIG, output_type=pytesseract.Output.DICT,
+                timeout=timeout
+            )
             
-            # Extract text
-            text = pytesseract.image_to_string(img, config=custom_config)
+            words = []
+            for i, word_text in enumerate(data['text']):
+                word_text = str(word_text).strip()
+                confidence = float(data['conf'][i])
+                # Page, block, paragraph and line rows carry conf -1 and no text
+                if confidence < 0 or not word_text:
+                    continue
+                
+                words.append({
+                    'text': word_text,
+                    'confidence': confidence,
+                    'left': int(data['left'][i]),
+                    'top': int(data['top'][i]),
+                    'width': int(data['width'][i]),
+                    'height': int(data['height'][i]),
+                    'block': int(data['block_num'][i]),
+                    'paragraph': int(data['par_num'][i]),
+                    'line': int(data['line_num'][i]),
+                })
             
-            # Get confidence scores
-            data = pytesseract.image_to_data(img, output_type=pytesseract.Output.DICT)
-            confidences = [int(conf) for conf in data['conf'] if int(conf) > 0]
+            confidences = [word['confidence'] for word in words if word['confidence'] > 0]
             avg_confidence = sum(confidences) / len(confidences) if confidences else 0
             
-            return text.strip(), avg_confidence
+            return {
+                'text': self._words_to_text(words),
+                'confidence': avg_confidence,
+                'words': words,
+            }
+            
+        except RuntimeError as e:
+            # pytesseract kills the process at the timeout; the page wasn't read, so don't cache it as blank
+            if timeout and 'timeout' in str(e).lower():
+                logger.warning(f"Tesseract timed out after {timeout:.1f}s")
+                return {'text': '', 'confidence': 0.0, 'words': [], 'degraded': True}
+            logger.error(f"Error with Tesseract OCR: {str(e)}")
+            return {'text': '', 'confidence': 0.0, 'words': []}
             
         except Exception as e:
             logger.error(f"Error with Tesseract OCR: {str(e)}")
-            return "", 0.0
+            return {'text': '', 'confidence': 0.0, 'words': []}
+    
+    def _words_to_text(self, words):
+        """
+        Lay Tesseract words out the way image_to_string does: words joined by
+        spaces, lines by newlines, paragraphs separated by a blank line
+        """
+        lines = []
+        current_key = None
+        current_paragraph = None
+        
+        for word in words:
+            key = (word['block'], word['paragraph'], word['line'])
+            if key != current_key:
+                paragraph = key[:2]
+                if current_paragraph is not None and paragraph != current_paragraph:
+                    lines.append('')
+                lines.append(word['text'])
+                current_key = key
+                current_paragraph = paragraph
+            else:
+                lines[-1] = f"{lines[-1]} {word['text']}"
+        
+        return '\n'.join(lines).strip()
     
-    def extract_text_easyocr(self, image_file):
+    def extract_text_easyocr(self, image):
         """
         Extract text using EasyOCR
         """
+        result = self.extract_easyocr_data(image)
+        return result['text'], result['confidence']
+    
+    def extract_easyocr_data(self, image, languages=None):
+        """
+        Run EasyOCR with the reader for the languages (default
+        OCR_LANGUAGES) and return the text, average confidence (percent)
+        and word boxes
+        """
         try:
-            import numpy as np
-            
-            # Read image
-            img = Image.open(image_file)
-            img_array = np.array(img)
-            
-            # Perform OCR
-            reader = self._get_easyocr_reader()
-            results = reader.readtext(img_array)
-            
-            # Extract text and calculate average confidence
-            text_parts = []
-            confidences = []
+            decoded = self.decode(image)
+            img_array = decoded.pixels
             
-            for (bbox, text, confidence) in results:
-                if confidence > 0.3:  # Filter low confidence results
-                    text_parts.append(text)
-                    confidences.append(confidence)
+            # The OCR service owns the models when one is configured
+            if settings.OCR_SERVICE_URL:
+                try:
+                    return recognize_remote(img_array, languages)
+                except OCRServiceError as e:
+                    # Load shedding or an outage, not an empty page: keep it out of the result cache
+                    logger.warning(f"OCR service unavailable: {str(e)}")
+                    return {'text': '', 'confidence': 0.0, 'words': [], 'degraded': True}
             
-            full_text = ' '.join(text_parts)
-            avg_confidence = sum(confidences) / len(confidences) if confidences else 0
+            # Perform OCR, batched with images from concurrent callers when enabled
+            if 'easyocr_detection' in decoded.derived:
+                # The detector already ran on this image (concurrent path); only recognize
+                reader = self._get_easyocr_reader(languages)
+                results = reader.recognize(img_array, *decoded.derived['easyocr_detection'])
+            elif settings.OCR_EASYOCR_BATCHING:
+                results = get_easyocr_batcher(languages).run(img_array)
+            else:
+                reader = self._get_easyocr_reader(languages)
+                results = reader.readtext(img_array)
             
-            return full_text.strip(), avg_confidence * 100  # Convert to percentage
+            return self._easyocr_results_to_data(results)
             
         except Exception as e:
             logger.error(f"Error with EasyOCR: {str(e)}")
-            return "", 0.0
+            return {'text': '', 'confidence': 0.0, 'words': []}
+    
+    def _easyocr_results_to_data(self, results):
+        """Convert EasyOCR (bbox, text, confidence) tuples to the shared result shape"""
+        words = []
+        confidences = []
+        
+        for (bbox, text, confidence) in results:
+            if confidence > 0.3:  # Filter low confidence results
+                xs = [point[0] for point in bbox]
+                ys = [point[1] for point in bbox]
+                words.append({
+                    'text': text,
+                    'confidence': confidence * 100,
+                    'left': int(min(xs)),
+                    'top': int(min(ys)),
+                    'width': int(max(xs) - min(xs)),
+                    'height': int(max(ys) - min(ys)),
+                })
+                confidences.append(confidence)
+        
+        full_text = ' '.join(word['text'] for word in words)
+        avg_confidence = sum(confidences) / len(confidences) if confidences else 0
+        
+        return {
+            'text': full_text.strip(),
+            'confidence': avg_confidence * 100,  # Convert to percentage
+            'words': words,
+        }
     
-    def extract_text_combined(self, image_file):
+    def extract_text_combined(self, image):
         """
         Use both Tesseract and EasyOCR, return best result
         """
+        result = self.extract_text_detailed(image)
+        return result['text'], result['confidence']
+    
+    def extract_text_detailed(self, image, strategy=None, previous_confidence=None, deadline=None,
+                              languages=None):
+        """
+        Run the OCR engines according to the configured strategy.
+        
+        'tiered' runs Tesseract first and only falls back to EasyOCR when its
+        confidence is below OCR_TESSERACT_ACCEPT_CONFIDENCE. When an earlier
+        run already fell short of that threshold (previous_confidence), both
+        engines are needed, so they run concurrently. 'concurrent' always runs
+        both in parallel. The result records which path was taken.
+        
+        deadline is a time.time() timestamp for the OCR budget. Tesseract, the
+        fastest engine, always runs; EasyOCR is skipped when the remaining
+        budget is below its typical latency and abandoned when the budget runs
+        out, keeping the best result so far. The result is then marked degraded.
+        
+        languages picks the EasyOCR reader, e.g. from the detected script.
+        """
+        strategy = strategy or settings.OCR_STRATEGY
+        accept_confidence = settings.OCR_TESSERACT_ACCEPT_CONFIDENCE
+        
+        if (strategy == 'tiered' and previous_confidence is not None
+                and previous_confidence < accept_confidence):
+            strategy = 'concurrent'
+        
         try:
-            # Try both OCR methods
-            tesseract_text, tesseract_conf = self.extract_text_tesseract(image_file)
-            easyocr_text, easyocr_conf = self.extract_text_easyocr(image_file)
+            # Decode once and let both engines read the same buffer
+            decoded = self.decode(image)
+            started = time.perf_counter()
+            degraded = False
+            
+            # Prepare each engine's source image up front so threads don't race to build it
+            tesseract_source = self.ocr_source(decoded, settings.OCR_TESSERACT_SOURCE)
+            
+            if strategy == 'concurrent' and not self._budget_too_short(deadline):
+                easyocr_source = self.ocr_source(decoded, settings.OCR_EASYOCR_SOURCE)
+                if settings.OCR_ROI_ENABLED:
+                    self._share_easyocr_regions(easyocr_source, tesseract_source, languages)
+                tesseract_future = submit_engine(
+                    'tesseract', self._run_engine, 'tesseract', tesseract_source,
+                    self._tesseract_timeout(deadline)
+                )
+                easyocr_future = submit_engine(
+                    'easyocr', self._run_engine, 'easyocr', easyocr_source, languages=languages
+                )
+                # Waited on as long as its subprocess may run; it can still be stuck in the queue
+                tesseract_result = self._wait_for_engine(
+                    tesseract_future, deadline, engine='Tesseract',
+                    minimum=settings.OCR_MIN_TESSERACT_SECONDS
+                )
+                if tesseract_result is None:
+                    tesseract_result = {'text': '', 'confidence': 0.0, 'words': [], 'degraded': True}
+                easyocr_result = self._wait_for_engine(easyocr_future, deadline)
+                degraded = easyocr_result is None
+                path = 'concurrent'
+            else:
+                tesseract_result = self._run_engine(
+                    'tesseract', tesseract_source, self._tesseract_timeout(deadline)
+                )
+                if tesseract_result['confidence'] >= accept_confidence:
+                    easyocr_result = None
+                    path = 'tesseract'
+                elif self._budget_too_short(deadline):
+                    # Not enough budget left for EasyOCR; settle for Tesseract
+                    easyocr_result = None
+                    degraded = True
+                    path = 'tesseract'
+                else:
+                    easyocr_source = self.ocr_source(decoded, settings.OCR_EASYOCR_SOURCE)
+                    if deadline is None:
+                        easyocr_result = self._run_engine('easyocr', easyocr_source, languages=languages)
+                    else:
+                        easyocr_future = submit_engine(
+                            'easyocr', self._run_engine, 'easyocr', easyocr_source, languages=languages
+                        )
+                        easyocr_result = self._wait_for_engine(easyocr_future, deadline)
+                        degraded = easyocr_result is None
+                    path = 'tesseract+easyocr'
             
-            # Return result with higher confidence
-            if tesseract_conf >= easyocr_conf:
-                return tesseract_text, tesseract_conf
+            # An engine cut short (timeout, OCR service busy) leaves a partial result
+            degraded = degraded or any(
+                engine_result.get('degraded', False)
+                for engine_result in (tesseract_result, easyocr_result) if engine_result
+            )
+            
+            # Keep the result with higher confidence
+            if easyocr_result is None or tesseract_result['confidence'] >= easyocr_result['confidence']:
+                result, engine = tesseract_result, 'tesseract'
             else:
-                return easyocr_text, easyocr_conf
+                result, engine = easyocr_result, 'easyocr'
+            
+            elapsed = time.perf_counter() - started
+            logger.info(
+                f"OCR path {path}{' (degraded)' if degraded else ''}: {engine} won with "
+                f"{result['confidence']:.1f}% (tesseract {tesseract_result['confidence']:.1f}%) "
+                f"in {elapsed:.2f}s"
+            )
+            
+            return dict(
+                result, engine=engine, path=path, degraded=degraded, seconds=elapsed,
+                roi_reduction=tesseract_result.get('roi_reduction')
+            )
                 
         except Exception as e:
             logger.error(f"Error in combined OCR: {str(e)}")
-            return "", 0.0
+            return {
+                'text': '', 'confidence': 0.0, 'words': [], 'engine': '', 'path': 'error',
+                'degraded': False, 'seconds': 0.0, 'roi_reduction': None, 'error': str(e)
+            }
+    
+    def _budget_too_short(self, deadline):
+        """
+        Whether the remaining budget can't fit a typical EasyOCR run, counting
+        the runs already queued or still running on the OCR executor ahead of it
+        """
+        if deadline is None:
+            return False
+        waves = 1 + engine_backlog('easyocr') // settings.OCR_ENGINE_THREADS
+        return deadline - time.time() < expected_engine_latency('easyocr') * waves
+    
+    def _tesseract_timeout(self, deadline):
+        """Subprocess timeout for Tesseract; it always gets a minimum slice of time"""
+        if deadline is None:
+            return 0
+        return max(deadline - time.time(), settings.OCR_MIN_TESSERACT_SECONDS)
+    
+    def _wait_for_engine(self, future, deadline, engine='EasyOCR', minimum=0):
+        """Engine result, or None if it didn't finish within the budget (at least minimum seconds)"""
+        timeout = None if deadline is None else max(deadline - time.time(), minimum)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            # Drops the run if it is still queued; a running engine can't be interrupted and
+            # finishes in the background, where _budget_too_short counts it
+            future.cancel()
+            logger.warning(f"OCR budget exhausted, abandoning {engine} result")
+            return None
+    
+    def _run_engine(self, engine, source, timeout=0, languages=None):
+        """Run one engine on its source image, mapping word boxes back to original pixels"""
+        started = time.perf_counter()
+        if engine == 'tesseract' and settings.OCR_ROI_ENABLED:
+            result = self._extract_tesseract_regions(source, timeout=timeout)
+        else:
+            # EasyOCR's own text detector already limits recognition to text boxes
+            result = self._recognize(engine, source, timeout=timeout, languages=languages)
+        record_engine_latency(engine, time.perf_counter() - started)
+        
+        if source.scale != 1.0:
+            for word in result['words']:
+                for key in ('left', 'top', 'width', 'height'):
+                    word[key] = int(round(word[key] / source.scale))
+        if source.skew:
+            self._unrotate_words(result['words'], source.skew, source.width / source.scale,
+                                 source.height / source.scale)
+        
+        return result
+    
+    def _unrotate_words(self, words, angle, width, height):
+        """Map word boxes found on an image deskewed by angle back to the unrotated pixels"""
+        import cv2
+        import numpy as np
+        
+        matrix = cv2.invertAffineTransform(cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0))
+        for word in words:
+            left, top = word['left'], word['top']
+            right, bottom = left + word['width'], top + word['height']
+            corners = np.array([[left, top, 1], [right, top, 1], [left, bottom, 1], [right, bottom, 1]], dtype=np.float64)
+            xs, ys = (corners @ matrix.T).T
+            # The box around the turned-back corners
+            word['left'], word['top'] = int(round(xs.min())), int(round(ys.min()))
+            word['width'], word['height'] = int(round(xs.max() - xs.min())), int(round(ys.max() - ys.min()))
+
+
+def recognize_tile(engine, pixels, timeout=0, languages=None):
+    """Recognize one tile; module-level so the tile process pool can pickle it"""
+    processor = ImageProcessor()
+    tile = DecodedImage(pixels)
+    if engine == 'tesseract':
+        return processor.extract_tesseract_data(tile, timeout=timeout)
+    return processor.extract_easyocr_data(tile, languages=languages)
 
 
 class MedicineExtractor:
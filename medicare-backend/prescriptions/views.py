@@ -1,33 +1,59 @@
-from rest_framework import generics, status, viewsets
+from rest_framework import generics, mixins, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.views import APIView
 from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
 from django.shortcuts import get_object_or_404
 from django.db import transaction
+from django.db.models import Prefetch
+from django.conf import settings
+from django.urls import reverse
 from django.contrib.auth import get_user_model
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils import timezone
+from django.utils.http import parse_etags
+from datetime import timedelta
+import json
 import logging
+import time
 
 User = get_user_model()
 
-from .models import Prescription, PrescriptionImage, Medicine, PrescriptionAnalytics
+from .models import Prescription, PrescriptionImage, Medicine, PrescriptionAnalytics, UploadSession
 from .serializers import (
     PrescriptionSerializer, PrescriptionListSerializer,
     PrescriptionImageSerializer, MedicineSerializer,
-    PrescriptionAnalyticsSerializer, PrescriptionUploadSerializer
+    PrescriptionAnalyticsSerializer, PrescriptionUploadSerializer,
+    UploadSessionCreateSerializer, UploadSessionSerializer
+)
+from .imaging import is_pdf
+from .renditions import get_rendition, rendition_etag
+from .resumable import (
+    ChunkTooLarge, UploadConflict, append_chunk, delete_parts, file_offsets,
+    is_complete, open_uploads, received_bytes
 )
 from .tasks import process_prescription_images
+from .uploads import StreamingUploadMixin, get_upload_error
 
 logger = logging.getLogger(__name__)
 
 
-class PrescriptionViewSet(viewsets.ModelViewSet):
+class PrescriptionViewSet(StreamingUploadMixin, viewsets.ModelViewSet):
     """ViewSet for managing prescriptions"""
     permission_classes = [IsAuthenticated]
     parser_classes = [MultiPartParser, FormParser]
     
     def get_queryset(self):
-        return Prescription.objects.filter(user=self.request.user)
+        queryset = Prescription.objects.filter(user=self.request.user)
+        if self.action == 'list':
+            # Image counts, thumbnails and medicine totals read these instead of querying per row
+            queryset = queryset.prefetch_related(
+                Prefetch('images', queryset=PrescriptionImage.objects.order_by('page_number', 'id')),
+                'medicines'
+            )
+        return queryset
     
     def get_serializer_class(self):
         if self.action == 'list':
@@ -42,110 +68,178 @@ class PrescriptionViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['post'])
     def upload(self, request):
         """Upload prescription images with OCR processing"""
+        upload_error = get_upload_error(request)
+        if upload_error:
+            return Response({'images': [upload_error]}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        
         serializer = PrescriptionUploadSerializer(data=request.data)
         
         if serializer.is_valid():
-            try:
-                with transaction.atomic():
-                    # Create prescription
-                    prescription_data = {
-                        'user': request.user,
-                        'title': serializer.validated_data.get('title', ''),
-                        'description': serializer.validated_data.get('description', ''),
-                        'doctor_name': serializer.validated_data.get('doctor_name', ''),
-                        'hospital_name': serializer.validated_data.get('hospital_name', ''),
-                        'prescription_date': serializer.validated_data.get('prescription_date'),
-                        'processing_status': 'processing'
-                    }
-                    
-                    prescription = Prescription.objects.create(**prescription_data)
-                    
-                    # Process and save images
-                    from .utils import ImageProcessor, MedicineExtractor
-                    image_processor = ImageProcessor()
-                    medicine_extractor = MedicineExtractor()
-                    
-                    processed_images = []
-                    all_extracted_text = []
-                    
-                    for image_file in serializer.validated_data['images']:
-                        # Create prescription image
-                        prescription_image = PrescriptionImage.objects.create(
-                            prescription=prescription,
-                            original_image=image_file
-                        )
-                        
-                        # Compress image
-                        compressed_image = image_processor.compress_image(image_file)
-                        if compressed_image:
-                            prescription_image.compressed_image.save(
-                                f"compressed_{prescription_image.id}.jpg",
-                                compressed_image,
-                                save=False
-                            )
-                        
-                        # Enhance image for OCR
-                        enhanced_image = image_processor.enhance_image_for_ocr(image_file)
-                        if enhanced_image:
-                            prescription_image.processed_image.save(
-                                f"processed_{prescription_image.id}.jpg",
-                                enhanced_image,
-                                save=False
-                            )
-                        
-                        # Extract text using OCR
-                        extracted_text, confidence = image_processor.extract_text_combined(image_file)
-                        prescription_image.extracted_text = extracted_text
-                        prescription_image.confidence_score = confidence
-                        prescription_image.save()
-                        
-                        if extracted_text:
-                            all_extracted_text.append(extracted_text)
-                        
-                        processed_images.append(prescription_image)
-                    
-                    # Extract medicines from all text
-                    combined_text = ' '.join(all_extracted_text)
-                    medicines_data = medicine_extractor.extract_medicines(combined_text)
-                    
-                    # Create medicine objects
-                    for med_data in medicines_data:
-                        Medicine.objects.create(
-                            prescription=prescription,
-                            **med_data
-                        )
-                    
-                    # Update prescription status
-                    prescription.is_processed = True
-                    prescription.processing_status = 'completed'
-                    prescription.save()
-                    
-                    # Update user analytics
-                    analytics, created = PrescriptionAnalytics.objects.get_or_create(
-                        user=request.user
+            return self.create_prescription(request, serializer.validated_data)
+        
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    def create_prescription(self, request, validated_data):
+        """
+        Create a Prescription from validated upload data, running OCR now or
+        leaving it to Celery. Shared by the upload and resumable upload endpoints.
+        """
+        process_async = validated_data.get('process_async')
+        if process_async is None:
+            process_async = settings.PRESCRIPTION_ASYNC_UPLOAD
+        if process_async:
+            return self._upload_async(request, validated_data)
+        
+        try:
+            with transaction.atomic():
+                # Create prescription
+                prescription = Prescription.objects.create(
+                    **self._prescription_data(request.user, validated_data, 'processing')
+                )
+                
+                # Process and save images
+                from .pipeline import PrescriptionImagePipeline, iter_upload_images
+                from .utils import MedicineExtractor
+                image_pipeline = PrescriptionImagePipeline()
+                medicine_extractor = MedicineExtractor()
+                
+                all_extracted_text = []
+                deadline = time.time() + settings.OCR_PRESCRIPTION_DEADLINE_SECONDS
+                
+                # PDFs are rasterized a page at a time, each page processed as its own image
+                for image_file, page_number in iter_upload_images(validated_data['images']):
+                    # Decode once, then compress, enhance and OCR off the same buffer
+                    prescription_image, decoded = image_pipeline.create_image(
+                        prescription, image_file, page_number
+                    )
+                    extracted_text, confidence = image_pipeline.process(
+                        prescription_image, decoded, deadline
                     )
-                    analytics.update_analytics()
-                    
-                    # Return response
-                    response_serializer = PrescriptionSerializer(prescription)
-                    return Response({
-                        'message': 'Prescription uploaded and processed successfully',
-                        'data': response_serializer.data
-                    }, status=status.HTTP_201_CREATED)
                     
-            except Exception as e:
-                logger.error(f"Error processing prescription: {str(e)}")
-                # Update prescription status to failed
-                if 'prescription' in locals():
-                    prescription.processing_status = 'failed'
-                    prescription.save()
+                    if extracted_text:
+                        all_extracted_text.append(extracted_text)
+                
+                # Extract medicines from all text
+                combined_text = ' '.join(all_extracted_text)
+                medicines_data = medicine_extractor.extract_medicines(combined_text)
+                
+                # Create medicine objects
+                for med_data in medicines_data:
+                    Medicine.objects.create(
+                        prescription=prescription,
+                        **med_data
+                    )
+                
+                # Update prescription status
+                prescription.is_processed = True
+                prescription.processing_status = 'completed'
+                prescription.save()
                 
+                # Update user analytics
+                analytics, created = PrescriptionAnalytics.objects.get_or_create(
+                    user=request.user
+                )
+                analytics.update_analytics()
+                
+                # Return response
+                response_serializer = PrescriptionSerializer(prescription)
                 return Response({
-                    'error': 'Failed to process prescription',
-                    'details': str(e)
-                }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+                    'message': 'Prescription uploaded and processed successfully',
+                    'data': response_serializer.data
+                }, status=status.HTTP_201_CREATED)
+                
+        except Exception as e:
+            logger.error(f"Error processing prescription: {str(e)}")
+            # Update prescription status to failed
+            if 'prescription' in locals():
+                prescription.processing_status = 'failed'
+                prescription.save()
+            
+            return Response({
+                'error': 'Failed to process prescription',
+                'details': str(e)
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
+    def _prescription_data(self, user, validated_data, processing_status):
+        """Build Prescription fields from validated upload data"""
+        return {
+            'user': user,
+            'title': validated_data.get('title', ''),
+            'description': validated_data.get('description', ''),
+            'doctor_name': validated_data.get('doctor_name', ''),
+            'hospital_name': validated_data.get('hospital_name', ''),
+            'prescription_date': validated_data.get('prescription_date'),
+            'processing_status': processing_status
+        }
+    
+    def _upload_async(self, request, validated_data):
+        """
+        Store the uploaded images and leave OCR to the Celery pipeline.
+        The request returns as soon as the images are committed.
+        """
+        try:
+            with transaction.atomic():
+                prescription = Prescription.objects.create(
+                    **self._prescription_data(request.user, validated_data, 'pending')
+                )
+                
+                # PDFs are stored as uploaded; the worker rasterizes them into page images
+                for image_file in validated_data['images']:
+                    PrescriptionImage.objects.create(
+                        prescription=prescription,
+                        original_image=image_file,
+                        format='PDF' if is_pdf(image_file) else None,
+                        file_size=image_file.size,
+                        # Hashed while streaming in
+                        content_hash=getattr(image_file, 'content_hash', None)
+                    )
+                
+                # Only enqueue once the images are visible to the workers
+                transaction.on_commit(
+                    lambda: self._enqueue_processing(prescription.id)
+                )
+                
+        except Exception as e:
+            logger.error(f"Error storing prescription upload: {str(e)}")
+            return Response({
+                'error': 'Failed to upload prescription',
+                'details': str(e)
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        status_url = request.build_absolute_uri(
+            reverse('prescription-processing-status', args=[prescription.id])
+        )
+        
+        response_serializer = PrescriptionSerializer(prescription)
+        return Response({
+            'message': 'Prescription uploaded, processing has been queued',
+            'status_url': status_url,
+            'data': response_serializer.data
+        }, status=status.HTTP_202_ACCEPTED, headers={'Location': status_url})
+    
+    def _enqueue_processing(self, prescription_id):
+        """Queue background OCR, marking the prescription failed if the broker is down"""
+        try:
+            process_prescription_images.delay(prescription_id)
+        except Exception as e:
+            logger.error(f"Error queueing prescription {prescription_id}: {str(e)}")
+            Prescription.objects.filter(id=prescription_id).update(processing_status='failed')
+    
+    @action(detail=True, methods=['get'], url_path='status')
+    def processing_status(self, request, pk=None):
+        """Report OCR processing progress for a prescription"""
+        prescription = self.get_object()
+        images = prescription.images.all()
+        
+        return Response({
+            'id': prescription.id,
+            'processing_status': prescription.processing_status,
+            'is_processed': prescription.is_processed,
+            'images_total': images.count(),
+            'images_processed': images.filter(processing_status='completed').count(),
+            'images_failed': images.filter(processing_status='failed').count(),
+            'updated_at': prescription.updated_at
+        })
     
     @action(detail=True, methods=['post'])
     def reprocess(self, request, pk=None):
@@ -156,8 +250,8 @@ class PrescriptionViewSet(viewsets.ModelViewSet):
             prescription.processing_status = 'processing'
             prescription.save()
             
-            # Trigger background processing
-            process_prescription_images.delay(prescription.id)
+            # Trigger background processing, re-running images that already completed
+            process_prescription_images.delay(prescription.id, force=True)
             
             return Response({
                 'message': 'Prescription reprocessing started'
@@ -204,6 +298,17 @@ class MedicineViewSet(viewsets.ReadOnlyModelViewSet):
         return Response(serializer.data)
 
 
+class RenditionRenderer(BaseRenderer):
+    """Lets image Accept headers through content negotiation; rendition bodies are sent as files"""
+    media_type = 'image/jpeg'
+    format = 'jpg'
+    charset = None
+    
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # Only error payloads are rendered here
+        return json.dumps(data).encode()
+
+
 class PrescriptionImageViewSet(viewsets.ReadOnlyModelViewSet):
     """ViewSet for viewing prescription images"""
     serializer_class = PrescriptionImageSerializer
@@ -211,10 +316,199 @@ class PrescriptionImageViewSet(viewsets.ReadOnlyModelViewSet):
     
     def get_queryset(self):
         return PrescriptionImage.objects.filter(prescription__user=self.request.user)
+    
+    @action(
+        detail=True, methods=['get'], url_path=r'renditions/(?P<rendition>[a-z]+)',
+        renderer_classes=[JSONRenderer, RenditionRenderer]
+    )
+    def rendition(self, request, pk=None, rendition=None):
+        """Downscaled JPEG of the image, rendered on first request and cached on disk"""
+        if rendition not in settings.PRESCRIPTION_IMAGE_RENDITIONS:
+            return Response({'error': 'Unknown rendition'}, status=status.HTTP_404_NOT_FOUND)
+        
+        prescription_image = self.get_object()
+        # A stored PDF has no pixels until the worker replaces it with its pages
+        if prescription_image.format == 'PDF':
+            return Response({'error': 'Image has no renditions'}, status=status.HTTP_404_NOT_FOUND)
+        
+        headers = {
+            'ETag': rendition_etag(prescription_image, rendition),
+            # Rendition content never changes for a URL; private as these are medical records
+            'Cache-Control': f"private, max-age={settings.RENDITION_MAX_AGE}, immutable",
+        }
+        
+        if headers['ETag'] in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
+        else:
+            try:
+                path = get_rendition(prescription_image, rendition)
+            except Exception as e:
+                logger.error(f"Error rendering {rendition} for image {prescription_image.id}: {str(e)}")
+                return Response({'error': 'Could not render image'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            response = FileResponse(open(path, 'rb'), content_type='image/jpeg')
+        
+        for name, value in headers.items():
+            response[name] = value
+        return response
+
+
+class UploadSessionViewSet(mixins.RetrieveModelMixin, mixins.DestroyModelMixin, viewsets.GenericViewSet):
+    """
+    Resumable uploads for large prescription sets. Create a session declaring
+    the files, PUT each file in chunks at its Upload-Offset, then finalize.
+    After a dropped connection, GET the session for the offsets to resume from.
+    """
+    serializer_class = UploadSessionSerializer
+    permission_classes = [IsAuthenticated]
+    
+    def get_queryset(self):
+        return UploadSession.objects.filter(user=self.request.user)
+    
+    def create(self, request):
+        """Open a session for the declared files"""
+        serializer = UploadSessionCreateSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Kept as sent, to be validated again together with the files on finalize
+        metadata = {
+            name: value for name, value in serializer.initial_data.items()
+            if name in serializer.fields and name != 'files'
+        }
+        session = UploadSession.objects.create(
+            user=request.user,
+            files=serializer.validated_data['files'],
+            metadata=metadata,
+            expires_at=timezone.now() + timedelta(hours=settings.UPLOAD_SESSION_TTL_HOURS)
+        )
+        
+        session_url = request.build_absolute_uri(reverse('upload-session-detail', args=[session.id]))
+        return Response(
+            UploadSessionSerializer(session).data,
+            status=status.HTTP_201_CREATED,
+            headers={'Location': session_url}
+        )
+    
+    def perform_destroy(self, instance):
+        delete_parts(instance)
+        instance.delete()
+    
+    @action(detail=True, methods=['put'], url_path=r'files/(?P<index>\d+)')
+    def chunk(self, request, pk=None, index=None):
+        """Append the request body to a file, starting at the Upload-Offset header"""
+        session = self.get_object()
+        closed = self._closed_response(session)
+        if closed:
+            return closed
+        
+        index = int(index)
+        if index >= len(session.files):
+            return Response({'error': 'No such file in this upload'}, status=status.HTTP_404_NOT_FOUND)
+        
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except (KeyError, ValueError):
+            return Response(
+                {'error': 'Upload-Offset and Content-Length headers are required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            # Read straight from the request stream, never buffering the chunk
+            new_offset = append_chunk(session, index, offset, request.stream, length)
+        except UploadConflict as e:
+            return Response(
+                {'error': str(e), 'offset': e.offset},
+                status=status.HTTP_409_CONFLICT,
+                headers={'Upload-Offset': str(e.offset)}
+            )
+        except ChunkTooLarge as e:
+            return Response({'error': str(e)}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        except OSError as e:
+            # The client went away mid-chunk; what arrived is kept
+            logger.warning(f"Chunk upload interrupted for session {session.id}: {str(e)}")
+            new_offset = received_bytes(session, index)
+            return Response(
+                {'error': 'Chunk upload was interrupted', 'offset': new_offset},
+                status=status.HTTP_400_BAD_REQUEST,
+                headers={'Upload-Offset': str(new_offset)}
+            )
+        
+        return Response(
+            {'offset': new_offset, 'size': session.files[index]['size']},
+            headers={'Upload-Offset': str(new_offset)}
+        )
+    
+    @action(detail=True, methods=['post'])
+    def finalize(self, request, pk=None):
+        """
+        Create the Prescription from the uploaded files through the regular
+        upload path. Finalizing again returns the same prescription.
+        """
+        # Locked only to claim the session, so OCR never runs holding the row lock
+        with transaction.atomic():
+            session = get_object_or_404(self.get_queryset().select_for_update(), pk=pk)
+            
+            if session.status == 'completed':
+                return Response({
+                    'message': 'Upload already finalized',
+                    'data': PrescriptionSerializer(session.prescription).data if session.prescription else None
+                })
+            
+            closed = self._closed_response(session)
+            if closed:
+                return closed
+            
+            if not is_complete(session):
+                return Response(
+                    {'error': 'Upload is incomplete', 'files': file_offsets(session)},
+                    status=status.HTTP_409_CONFLICT
+                )
+            
+            session.status = 'finalizing'
+            session.save(update_fields=['status', 'updated_at'])
+        
+        uploads = open_uploads(session)
+        try:
+            serializer = PrescriptionUploadSerializer(data={**session.metadata, 'images': uploads})
+            if serializer.is_valid():
+                response = PrescriptionViewSet().create_prescription(request, serializer.validated_data)
+            else:
+                response = Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        except Exception:
+            session.status = 'open'
+            session.save(update_fields=['status', 'updated_at'])
+            raise
+        finally:
+            for upload in uploads:
+                upload.close()
+        
+        if status.is_success(response.status_code):
+            session.status = 'completed'
+            session.prescription_id = response.data['data']['id']
+            session.save(update_fields=['status', 'prescription', 'updated_at'])
+            delete_parts(session)
+        else:
+            # Reopened so the client can fix the upload and finalize again
+            session.status = 'open'
+            session.save(update_fields=['status', 'updated_at'])
+        
+        return response
+    
+    def _closed_response(self, session):
+        """Error response for a session that no longer takes chunks, or None"""
+        if session.status == 'completed':
+            return Response({'error': 'Upload already finalized'}, status=status.HTTP_409_CONFLICT)
+        if session.is_finalizing:
+            return Response({'error': 'Upload is being finalized'}, status=status.HTTP_409_CONFLICT)
+        if session.is_expired:
+            return Response({'error': 'Upload session has expired'}, status=status.HTTP_410_GONE)
+        return None
 
 
 # API Views for specific endpoints
-class PrescriptionUploadView(generics.CreateAPIView):
+class PrescriptionUploadView(StreamingUploadMixin, generics.CreateAPIView):
     """Dedicated view for prescription upload"""
     serializer_class = PrescriptionUploadSerializer
     permission_classes = [IsAuthenticated]
@@ -239,3 +533,12 @@ class UserAnalyticsView(generics.RetrieveAPIView):
             analytics.update_analytics()
         
         return analytics
+
+
+class OCREngineStatsView(APIView):
+    """Load time and memory of the OCR engines loaded in this process"""
+    permission_classes = [IsAdminUser]
+    
+    def get(self, request):
+        from .engines import engine_stats
+        return Response(engine_stats())